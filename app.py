@@ -1,6 +1,20 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, g
+from werkzeug.http import is_resource_modified
 from data_collector import DataCollector
-from datetime import datetime, timedelta
+from price_cache import MAX_STALENESS_DAYS
+from response_cache import ResponseCache
+from jobs import JobQueue
+from metrics import REGISTRY, METRICS_DIR, HTTP_REQUEST_SECONDS
+from events import PricePublisher, format_sse
+from timeseries import compute_curves
+from simulation import simulate_batch, STRATEGIES
+from export import EXPORT_FORMATS, arrow_available, export_chunks
+from portfolio import backtest_portfolios, weight_grid, REBALANCE_FREQUENCIES
+from datetime import datetime, timedelta, timezone
+from math import comb
+import hashlib
+import time
+import numpy as np
 import logging
 
 app = Flask(__name__)
@@ -9,7 +23,13 @@ logger = logging.getLogger(__name__)
 
 class LocalInvestmentComparator:
     def __init__(self):
-        self.collector = DataCollector()
+        # O servidor só lê: sem DDL na inicialização (se o banco já existe)
+        self.collector = DataCollector(use_cache=True, init_db=False)
+
+    @property
+    def assets(self):
+        """Ativos comparados (registro de ativos ativos): nome exibido -> símbolo"""
+        return {asset['name']: asset['symbol'] for asset in self.collector.get_assets()}
 
     def calculate_investment_return(self, initial_amount, start_price, end_price):
         """Calcula o retorno do investimento"""
@@ -34,33 +54,15 @@ class LocalInvestmentComparator:
         """Compara múltiplos investimentos usando dados locais"""
         results = {}
 
-        # Bitcoin
-        logger.info(f"Buscando Bitcoin para {start_date}")
-        btc_start_price = self.collector.get_bitcoin_price(start_date)
-        btc_end_price = self.collector.get_bitcoin_price()
-
-        logger.info(f"Bitcoin - Preço inicial: {btc_start_price}, Preço final: {btc_end_price}")
-
-        if btc_start_price and btc_end_price:
-            btc_result = self.calculate_investment_return(amount, btc_start_price, btc_end_price)
-            if btc_result:
-                results['Bitcoin'] = btc_result
-
-        # Outros ativos
-        assets = {
-            'Ibovespa (BOVA11)': 'BOVA11.SA',
-            'Petrobras (PETR4)': 'PETR4.SA',
-            'Itaú (ITUB4)': 'ITUB4.SA',
-            'Vale (VALE3)': 'VALE3.SA',
-            'Banco do Brasil (BBAS3)': 'BBAS3.SA'
-        }
+        assets = self.assets
+
+        # Uma única consulta para todos os ativos
+        prices = self.collector.get_price_pairs(list(assets.values()), start_date, end_date, include_bitcoin=False)
 
         for asset_name, symbol in assets.items():
-            logger.info(f"Buscando {asset_name}")
-            start_price = self.collector.get_stock_price(symbol, start_date)
-            end_price = self.collector.get_stock_price(symbol)
+            start_price, end_price = prices.get(symbol, (None, None))
 
-            logger.info(f"{asset_name} - Preço inicial: {start_price}, Preço final: {end_price}")
+            logger.debug(f"{asset_name} - Preço inicial: {start_price}, Preço final: {end_price}")
 
             if start_price and end_price:
                 result = self.calculate_investment_return(amount, start_price, end_price)
@@ -69,39 +71,413 @@ class LocalInvestmentComparator:
 
         return results
 
+    def compare_timeseries(self, start_date, end_date, amount=1.0):
+        """Calcula a evolução diária do investimento em todos os ativos"""
+        # Desde MAX_STALENESS_DAYS antes do início: a idade máxima do preço vigente na data inicial
+        assets = self.assets
+        history = self.collector.get_price_history(
+            list(assets.values()), start_date - timedelta(days=MAX_STALENESS_DAYS), end_date)
+        named = {name: history[symbol] for name, symbol in assets.items() if symbol in history}
+        if not named:
+            return [], {}
+        return compute_curves(named, start_date, end_date, amount)
+
+    def simulate(self, start_dates, end_date, amounts, strategies=STRATEGIES):
+        """Simula aporte único e aportes periódicos para vários cenários"""
+        assets = self.assets
+        history = self.collector.get_price_history(
+            list(assets.values()), min(start_dates) - timedelta(days=MAX_STALENESS_DAYS), end_date)
+        named = {name: history[symbol] for name, symbol in assets.items() if symbol in history}
+        if not named:
+            return {}
+        return simulate_batch(named, start_dates, end_date, amounts, strategies)
+
+    def backtest(self, symbols, weights, start_date, end_date, **options):
+        """Simula carteiras com os `symbols` (Bitcoin e ações gravadas) nos pesos dados
+
+        Retorna (datas, resultados) de backtest_portfolios ou None se algum
+        símbolo não tiver dados no banco.
+        """
+        # Desde MAX_STALENESS_DAYS antes do início: a idade máxima do preço vigente na data inicial
+        history = self.collector.get_price_history(symbols, start_date - timedelta(days=MAX_STALENESS_DAYS), end_date)
+        missing = [symbol for symbol in symbols if symbol not in history]
+        if missing:
+            raise ValueError(f"Sem dados para: {', '.join(missing)}")
+        return backtest_portfolios({symbol: history[symbol] for symbol in symbols},
+                                   weights, start_date, end_date, **options)
+
+    def scale_results(self, results, amount):
+        """Ajusta resultados calculados para R$ 1 ao valor investido"""
+        scaled = {}
+        for asset_name, result in results.items():
+            scaled[asset_name] = dict(
+                result,
+                initial_amount=amount,
+                shares_bought=result['shares_bought'] * amount,
+                final_value=result['final_value'] * amount,
+                profit_loss=result['profit_loss'] * amount
+            )
+        return scaled
+
 comparator = LocalInvestmentComparator()
 
+# Limite de datas iniciais por simulação
+MAX_SIMULATION_START_DATES = 1000
+
+# Limite de combinações de pesos por backtest de carteiras e de séries diárias devolvidas
+MAX_PORTFOLIO_COMBINATIONS = 5000
+MAX_PORTFOLIO_PATHS = 20
+
+# Limites de pontos por consulta intradiária
+DEFAULT_INTRADAY_POINTS = 500
+MAX_INTRADAY_POINTS = 5000
+
+def parse_timestamp(value):
+    """Converte epoch (segundos) ou data/hora ISO (UTC se sem fuso) em epoch"""
+    if str(value).lstrip('-').isdigit():
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+def to_json_array(values, decimals=2):
+    """Converte array NumPy em listas JSON, trocando NaN por null"""
+    values = np.round(np.asarray(values, dtype=float), decimals)
+    return np.where(np.isnan(values), None, values).tolist()
+
+# Atualizações de dados rodam fora das requisições
+job_queue = JobQueue()
+
+# Resultados por (rota, parâmetros, versão dos dados)
+response_cache = ResponseCache(max_entries=512, ttl=300)
+
+# Preço do Bitcoin enviado por SSE aos clientes conectados
+price_publisher = PricePublisher(comparator.collector)
+
+# Intervalo (s) dos comentários que mantêm a conexão SSE aberta
+SSE_KEEPALIVE_SECONDS = 15
+
+# Métricas lidas no momento da coleta pelo /metrics
+DATA_VERSION = REGISTRY.gauge('data_version', 'Versão atual dos dados de preços', aggregate='max')
+SSE_SUBSCRIBERS = REGISTRY.gauge('sse_subscribers', 'Clientes conectados ao /stream')
+
+def collect_metrics():
+    DATA_VERSION.set(comparator.collector.get_data_version())
+    SSE_SUBSCRIBERS.set(price_publisher.subscribers)
+
+REGISTRY.add_collector(collect_metrics)
+
+# Vários workers (asgi.py): /metrics soma os valores de todos eles
+if METRICS_DIR:
+    REGISTRY.share(METRICS_DIR)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'desconhecido',
+            method=request.method,
+            status=response.status_code
+        )
+    return response
+
+def data_validators(key):
+    """Gera versão, ETag e Last-Modified a partir do estado dos dados"""
+    version, updated_at = comparator.collector.get_data_state()
+    etag = hashlib.sha1(repr((key, version)).encode()).hexdigest()
+    last_modified = datetime.fromtimestamp(updated_at, timezone.utc) if updated_at else None
+    return version, etag, last_modified
+
+def with_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True  # Sempre revalidar com o ETag
+    return response
+
+def conditional_result(key, compute, environ):
+    """Resultado em cache para `key`, ou None se o cliente já tiver essa versão
+
+    `environ` só precisa dos cabeçalhos condicionais (HTTP_IF_NONE_MATCH,
+    HTTP_IF_MODIFIED_SINCE). Retorna (resultado, ETag, Last-Modified).
+    """
+    version, etag, last_modified = data_validators(key)
+    if not is_resource_modified(environ, etag=etag, last_modified=last_modified):
+        return None, etag, last_modified
+    return response_cache.get_or_compute((key, version), compute), etag, last_modified
+
+def cached_json(key, compute):
+    """Responde com o resultado em cache ou 304 se o cliente já o tiver"""
+    result, etag, last_modified = conditional_result(key, compute, request.environ)
+    if result is None:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(result)
+    return with_validators(response, etag, last_modified)
+
+def compare_result(data):
+    """Calcula o /compare: retorna (corpo, ETag, Last-Modified)
+
+    Sem dados para nenhum ativo, o corpo é um erro e não há validadores.
+    """
+    amount = float(data['amount'])
+    start_date = datetime.strptime(data['start_date'], '%Y-%m-%d')
+    end_date = datetime.strptime(data['end_date'], '%Y-%m-%d')
+
+    logger.debug(f"Comparando investimento de R$ {amount} de {start_date} até {end_date}")
+
+    # O resultado é proporcional ao valor: o cache guarda o cálculo para R$ 1
+    key = ('compare', start_date.date(), end_date.date())
+    version, etag, last_modified = data_validators(key + (amount,))
+    unit_results = response_cache.get_or_compute(
+        (key, version), lambda: comparator.compare_investments(1.0, start_date, end_date))
+    results = comparator.scale_results(unit_results, amount)
+
+    if not results:
+        return {
+            'success': False,
+            'error': 'Não foi possível obter dados para nenhum ativo. Execute data_collector.py primeiro.'
+        }, None, None
+
+    logger.debug(f"Resultados obtidos: {list(results.keys())}")
+    return {'success': True, 'results': results}, etag, last_modified
+
+def bitcoin_price_result():
+    return {
+        'success': True,
+        'price': comparator.collector.get_bitcoin_price(),
+        'currency': 'BRL'
+    }
+
+def data_status_result():
+    return {
+        'success': True,
+        'summary': comparator.collector.get_data_summary()
+    }
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/compare', methods=['POST'])
 def compare():
+    try:
+        body, etag, last_modified = compare_result(request.json)
+        if etag is None:
+            return jsonify(body)
+        return with_validators(jsonify(body), etag, last_modified)
+
+    except Exception as e:
+        logger.error(f"Erro no compare: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        })
+
+@app.route('/timeseries', methods=['POST'])
+def timeseries():
+    """Evolução diária do valor investido, retorno acumulado e drawdown"""
     try:
         data = request.json
         amount = float(data['amount'])
         start_date = datetime.strptime(data['start_date'], '%Y-%m-%d')
         end_date = datetime.strptime(data['end_date'], '%Y-%m-%d')
 
-        logger.info(f"Comparando investimento de R$ {amount} de {start_date} até {end_date}")
+        # As curvas são proporcionais ao valor: o cache guarda o cálculo para R$ 1
+        key = ('timeseries', start_date.date(), end_date.date())
+        version, etag, last_modified = data_validators(key + (amount,))
+        dates, curves = response_cache.get_or_compute(
+            (key, version), lambda: comparator.compare_timeseries(start_date, end_date))
+
+        if not curves:
+            return jsonify({
+                'success': False,
+                'error': 'Não foi possível obter dados para nenhum ativo. Execute data_collector.py primeiro.'
+            })
+
+        series = {}
+        for asset_name, curve in curves.items():
+            series[asset_name] = {
+                'values': np.round(curve['values'] * amount, 2).tolist(),
+                'cumulative_return': np.round(curve['cumulative_return'] * 100, 4).tolist(),
+                'drawdown': np.round(curve['drawdown'] * 100, 4).tolist(),
+                'final_value': curve['final_value'] * amount,
+                'return_percentage': curve['return_percentage'],
+                'max_drawdown_percentage': curve['max_drawdown_percentage']
+            }
 
-        results = comparator.compare_investments(amount, start_date, end_date)
+        return with_validators(jsonify({
+            'success': True,
+            'dates': [str(d) for d in dates],
+            'series': series
+        }), etag, last_modified)
 
+    except Exception as e:
+        logger.error(f"Erro no timeseries: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        })
+
+@app.route('/simulate', methods=['POST'])
+def simulate():
+    """Simula em lote aporte único e aportes semanais/mensais
+
+    Aceita `start_dates` (lista) ou `start_from`/`start_to`/`step_days`,
+    `amounts` (ou `amount`), `end_date` e opcionalmente `strategies`.
+    """
+    try:
+        data = request.json
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d')
+        amounts = [float(a) for a in data.get('amounts', [data.get('amount', 1000)])]
+        strategies = data.get('strategies', list(STRATEGIES))
+
+        if 'start_dates' in data:
+            start_dates = [datetime.strptime(d, '%Y-%m-%d') for d in data['start_dates']]
+        else:
+            start_from = datetime.strptime(data['start_from'], '%Y-%m-%d')
+            start_to = datetime.strptime(data.get('start_to', data['end_date']), '%Y-%m-%d')
+            step = timedelta(days=int(data.get('step_days', 1)))
+            start_dates = []
+            while start_from <= start_to and len(start_dates) <= MAX_SIMULATION_START_DATES:
+                start_dates.append(start_from)
+                start_from += step
+
+        if not start_dates or len(start_dates) > MAX_SIMULATION_START_DATES:
+            return jsonify({
+                'success': False,
+                'error': f'Informe entre 1 e {MAX_SIMULATION_START_DATES} datas iniciais'
+            })
+        unknown = [s for s in strategies if s not in STRATEGIES]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f'Estratégias desconhecidas: {", ".join(unknown)}'
+            })
+
+        results = comparator.simulate(start_dates, end_date, amounts, strategies)
         if not results:
             return jsonify({
                 'success': False,
                 'error': 'Não foi possível obter dados para nenhum ativo. Execute data_collector.py primeiro.'
             })
 
-        logger.info(f"Resultados obtidos: {list(results.keys())}")
-
         return jsonify({
             'success': True,
-            'results': results
+            'start_dates': [d.strftime('%Y-%m-%d') for d in start_dates],
+            'amounts': amounts,
+            'results': {
+                asset_name: {
+                    strategy: {
+                        'final_value': to_json_array(result['final_value']),
+                        'return_percentage': to_json_array(result['return_percentage'], 4),
+                        'contributions': result['contributions'].tolist()
+                    }
+                    for strategy, result in by_strategy.items()
+                }
+                for asset_name, by_strategy in results.items()
+            }
         })
 
     except Exception as e:
-        logger.error(f"Erro no compare: {e}")
+        logger.error(f"Erro na simulação: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        })
+
+@app.route('/portfolio', methods=['POST'])
+def portfolio():
+    """Backtest de carteiras com rebalanceamento periódico e custos de transação
+
+    Aceita `symbols`, `weights` (uma lista de pesos ou uma lista de
+    combinações, na ordem de `symbols`) ou `weight_step` (varre todas as
+    alocações com pesos múltiplos do passo), `start_date`, `end_date`,
+    `amount`, `rebalance` (none, daily, weekly, monthly, quarterly ou
+    yearly), `cost_bps` (um valor ou um por símbolo) e `risk_free_rate`
+    (anual, em %). Os valores diários vêm para até MAX_PORTFOLIO_PATHS
+    combinações.
+    """
+    try:
+        data = request.json
+        symbols = list(data['symbols'])
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d')
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d')
+        amount = float(data.get('amount', 1000))
+        rebalance = data.get('rebalance', 'monthly')
+
+        if not symbols or len(set(symbols)) != len(symbols) or start_date >= end_date:
+            return jsonify({
+                'success': False,
+                'error': 'Informe símbolos distintos e um período válido'
+            })
+        if rebalance not in REBALANCE_FREQUENCIES:
+            return jsonify({
+                'success': False,
+                'error': f'Rebalanceamento desconhecido: {rebalance} (use {", ".join(REBALANCE_FREQUENCIES)})'
+            })
+
+        if 'weight_step' in data:
+            step = float(data['weight_step'])
+            parts = round(1 / step) if 0 < step <= 1 else 0
+            count = comb(parts + len(symbols) - 1, len(symbols) - 1) if parts else 0
+            if not parts or abs(parts * step - 1) > 1e-9 or count > MAX_PORTFOLIO_COMBINATIONS:
+                return jsonify({
+                    'success': False,
+                    'error': f'weight_step deve dividir 1 e gerar até {MAX_PORTFOLIO_COMBINATIONS} combinações'
+                })
+            weights = weight_grid(len(symbols), step)
+        else:
+            weights = np.atleast_2d(np.asarray(data['weights'], dtype=float))
+            if len(weights) > MAX_PORTFOLIO_COMBINATIONS:
+                return jsonify({
+                    'success': False,
+                    'error': f'Informe até {MAX_PORTFOLIO_COMBINATIONS} combinações de pesos'
+                })
+
+        keep_values = len(weights) <= MAX_PORTFOLIO_PATHS
+        dates, results = comparator.backtest(
+            symbols, weights, start_date, end_date, rebalance=rebalance,
+            cost_bps=data.get('cost_bps', 0), amount=amount,
+            risk_free_rate=float(data.get('risk_free_rate', 0)) / 100, keep_values=keep_values
+        )
+
+        response = {
+            'success': True,
+            'symbols': symbols,
+            'rebalance': rebalance,
+            'rebalances': results['rebalances'],
+            'amount': amount,
+            'weights': np.round(results['weights'], 4).tolist(),
+            'results': {
+                'final_value': to_json_array(results['final_value']),
+                'return_percentage': to_json_array(results['return_percentage'], 4),
+                'annualized_return_percentage': to_json_array(results['annualized_return_percentage'], 4),
+                'volatility_percentage': to_json_array(results['volatility_percentage'], 4),
+                'sharpe': to_json_array(results['sharpe'], 4),
+                'max_drawdown_percentage': to_json_array(results['max_drawdown_percentage'], 4),
+                'turnover': to_json_array(results['turnover'], 4),
+                'costs': to_json_array(results['costs'])
+            }
+        }
+        if keep_values:
+            response['dates'] = [str(d) for d in dates]
+            response['values'] = to_json_array(results['values'])
+        return jsonify(response)
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+    except Exception as e:
+        logger.error(f"Erro no backtest de carteiras: {e}")
         return jsonify({
             'success': False,
             'error': f'Erro interno: {str(e)}'
@@ -110,44 +486,180 @@ def compare():
 @app.route('/bitcoin-price')
 def bitcoin_price():
     try:
-        price = comparator.collector.get_bitcoin_price()
+        return cached_json(('bitcoin-price',), bitcoin_price_result)
+    except Exception as e:
+        logger.error(f"Erro ao obter preço do Bitcoin: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/bitcoin-intraday')
+def bitcoin_intraday():
+    """Barras OHLC intradiárias do Bitcoin, reagrupadas para caber em max_points
+
+    Parâmetros: `start` e `end` (epoch ou ISO; padrão: últimas 24h) e
+    `max_points`.
+    """
+    try:
+        end = parse_timestamp(request.args['end']) if 'end' in request.args else int(time.time())
+        start = parse_timestamp(request.args['start']) if 'start' in request.args else end - 86400
+        max_points = min(int(request.args.get('max_points', DEFAULT_INTRADAY_POINTS)), MAX_INTRADAY_POINTS)
+        if start >= end or max_points < 1:
+            return jsonify({
+                'success': False,
+                'error': 'Intervalo ou max_points inválido'
+            })
+
+        bars, step = comparator.collector.get_bitcoin_intraday(start, end, max_points)
         return jsonify({
             'success': True,
-            'price': price,
-            'currency': 'BRL'
+            'step_seconds': step,
+            'currency': 'BRL',
+            'ts': bars['ts'].tolist(),
+            **{field: to_json_array(bars[field]) for field in ('open', 'high', 'low', 'close', 'volume')}
         })
+
     except Exception as e:
-        logger.error(f"Erro ao obter preço do Bitcoin: {e}")
+        logger.error(f"Erro no intradiário: {e}")
         return jsonify({
             'success': False,
-            'error': str(e)
+            'error': f'Erro interno: {str(e)}'
         })
 
+@app.route('/stream')
+def stream():
+    """Eventos (SSE) com o preço do Bitcoin e a versão dos dados a cada atualização"""
+    subscription = price_publisher.subscribe()
+
+    def events():
+        try:
+            while True:
+                event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                yield format_sse(event) if event else ': keepalive\n\n'
+        finally:
+            price_publisher.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Não acumular no proxy reverso
+    })
+
+@app.route('/export')
+def export():
+    """Exporta o histórico de preços (BRL) em CSV, Arrow (stream IPC) ou Parquet
+
+    Parâmetros: `symbols` (separados por vírgula; padrão: todos),
+    `start_date`, `end_date` (YYYY-MM-DD) e `format` (csv, arrow ou
+    parquet). A resposta é enviada lote a lote, sem montar o arquivo na
+    memória.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f"Formato inválido: {fmt} (use {', '.join(EXPORT_FORMATS)})"
+        }), 400
+    if fmt != 'csv' and not arrow_available():
+        return jsonify({
+            'success': False,
+            'error': f'Exportação {fmt} requer o pacote pyarrow'
+        }), 501
+
+    try:
+        dates = {name: datetime.strptime(request.args[name], '%Y-%m-%d')
+                 for name in ('start_date', 'end_date') if name in request.args}
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Data inválida: {str(e)}'
+        }), 400
+    symbols = request.args.get('symbols')
+    if symbols is not None:
+        symbols = [s.strip() for s in symbols.split(',') if s.strip()]
+
+    batches = comparator.collector.iter_price_batches(symbols, dates.get('start_date'), dates.get('end_date'))
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return Response(export_chunks(batches, fmt), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=prices.{extension}'
+    })
+
 @app.route('/data-status')
 def data_status():
     """Mostra status dos dados armazenados"""
     try:
-        summary = comparator.collector.get_data_summary()
+        return cached_json(('data-status',), data_status_result)
+    except Exception as e:
         return jsonify({
-            'success': True,
-            'summary': summary
+            'success': False,
+            'error': str(e)
         })
+
+@app.route('/metrics')
+def metrics():
+    """Métricas no formato texto do Prometheus (somadas entre os workers, se houver METRICS_DIR)"""
+    return app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def refresh_data(run_id, progress=None):
+    """Atualiza os dados (executado pela fila de jobs)
+
+    Respeita o lock de coleta entre processos: se o scheduler (ou outro
+    worker) já estiver coletando, a execução é registrada como 'skipped'.
+    """
+    run = comparator.collector.run_collection(days=7, kind='manual', trigger='update-data',
+                                              progress=progress, run_id=run_id)
+    if run['status'] == 'failed':
+        raise RuntimeError(run['error'])
+    return {
+        'run': run,
+        'summary': comparator.collector.get_data_summary()
+    }
+
+@app.route('/update-data', methods=['GET', 'POST'])
+def update_data():
+    """Agenda atualização dos dados e retorna a execução imediatamente
+
+    O andamento fica na tabela collection_runs e é acompanhado em
+    /runs/<id>, respondido por qualquer worker (o job só existe no worker
+    que recebeu a requisição). Pedidos feitos enquanto outro ainda está na
+    fila deste worker são agrupados a ele.
+    """
+    try:
+        collector = comparator.collector
+        run_id = collector.queue_run(days=7, kind='manual', trigger='update-data')
+        job = job_queue.submit('update-data', refresh_data, run_id)
+        if job.args[0] != run_id:
+            # Agrupado a um job já pendente: acompanha a execução dele
+            collector.skip_run(run_id, f"Agrupada à coleta {job.args[0]}")
+            run_id = job.args[0]
+        return jsonify({
+            'success': True,
+            'message': 'Atualização agendada',
+            'run': collector.get_run(run_id),
+            'job': job.to_dict(),
+            'status_url': f'/runs/{run_id}'
+        }), 202
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         })
 
-@app.route('/update-data')
-def update_data():
-    """Força atualização dos dados"""
+@app.route('/runs')
+def collection_runs():
+    """Histórico de coletas (scheduler, /update-data e linha de comando)
+
+    Parâmetros opcionais: `limit` (padrão 20), `trigger` e `status`.
+    """
     try:
-        comparator.collector.update_all_data(days=7)
-        summary = comparator.collector.get_data_summary()
+        runs = comparator.collector.get_runs(
+            limit=min(int(request.args.get('limit', 20)), 500),
+            trigger=request.args.get('trigger'),
+            status=request.args.get('status')
+        )
         return jsonify({
             'success': True,
-            'message': 'Dados atualizados com sucesso',
-            'summary': summary
+            'runs': runs
         })
     except Exception as e:
         return jsonify({
@@ -155,10 +667,39 @@ def update_data():
             'error': str(e)
         })
 
+@app.route('/runs/<int:run_id>')
+def collection_run(run_id):
+    """Uma execução de coleta (status de um /update-data, em qualquer worker)"""
+    run = comparator.collector.get_run(run_id)
+    if run is None:
+        return jsonify({
+            'success': False,
+            'error': 'Execução não encontrada'
+        }), 404
+    return jsonify({
+        'success': True,
+        'run': run
+    })
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Mostra andamento e tempos de um job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job não encontrado'
+        }), 404
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
 if __name__ == '__main__':
     print("🚀 Iniciando aplicação com banco de dados local...")
     print("📊 Certifique-se de executar data_collector.py primeiro")
     print("🌐 Acesse: http://localhost:5000")
     print("📈 Status dos dados: http://localhost:5000/data-status")
-    print("🔄 Atualizar dados: http://localhost:5000/update-data")
+    print("🔄 Atualizar dados: http://localhost:5000/update-data (acompanhe em /runs/<id>)")
+    print("🏭 Produção: python asgi.py --workers 4")
     app.run(debug=True)
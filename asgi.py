@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Servidor de produção (ASGI) da comparação de investimentos
+
+/compare, /bitcoin-price e /data-status são atendidos por handlers
+assíncronos que fazem as leituras do banco em um pool de threads, fora do
+event loop; /stream (SSE) mantém cada cliente como uma corrotina, sem
+ocupar uma thread. As demais rotas continuam no app Flask, montado como WSGI.
+Cada worker é um processo com suas próprias conexões e cache de preços,
+todos lendo o mesmo banco (WAL permite leitores simultâneos).
+
+As métricas também são por processo: com vários workers, o /metrics soma
+as de todos através do diretório METRICS_DIR (um arquivo por worker).
+`python asgi.py` cria e limpa esse diretório; ao chamar o uvicorn
+diretamente, defina METRICS_DIR com um diretório vazio antes de iniciar.
+
+    python asgi.py --workers 4 --port 8000
+    METRICS_DIR=/tmp/btc-metrics uvicorn asgi:application --workers 4
+"""
+
+import argparse
+import asyncio
+import functools
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import http_date, quote_etag
+
+from app import (app as flask_app, compare_result, bitcoin_price_result, data_status_result,
+                 conditional_result, price_publisher, SSE_KEEPALIVE_SECONDS)
+from events import AsyncSubscription, format_sse
+from metrics import HTTP_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Threads por worker para as leituras do banco (cada uma com sua conexão)
+DB_READ_THREADS = int(os.environ.get('DB_READ_THREADS', 8))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_READ_THREADS, thread_name_prefix='db-read')
+
+async def run_blocking(func, *args):
+    """Executa uma função bloqueante (banco, NumPy) no pool de leitura"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args))
+
+def json_response(body, etag=None, last_modified=None):
+    """Resposta JSON (ou 304 se body for None) com os mesmos validadores do Flask"""
+    headers = {}
+    if etag is not None:
+        headers['ETag'] = quote_etag(etag)
+        headers['Cache-Control'] = 'no-cache'  # Sempre revalidar com o ETag
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified)
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(flask_app.json.dumps(body), media_type='application/json', headers=headers)
+
+def conditional_environ(request):
+    """Cabeçalhos condicionais no formato WSGI esperado por conditional_result"""
+    environ = {'REQUEST_METHOD': request.method}
+    for header in ('if-none-match', 'if-modified-since'):
+        if header in request.headers:
+            environ['HTTP_' + header.upper().replace('-', '_')] = request.headers[header]
+    return environ
+
+def timed(endpoint):
+    """Registra a duração do handler em http_request_seconds (como o Flask faz)"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await handler(request)
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                endpoint=endpoint, method=request.method, status=response.status_code
+            )
+            return response
+        return wrapper
+    return decorator
+
+@timed('compare')
+async def compare(request):
+    try:
+        data = await request.json()
+        body, etag, last_modified = await run_blocking(compare_result, data)
+        return json_response(body, etag, last_modified)
+    except Exception as e:
+        logger.error(f"Erro no compare: {e}")
+        return json_response({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        })
+
+@timed('bitcoin_price')
+async def bitcoin_price(request):
+    try:
+        return json_response(*await run_blocking(
+            conditional_result, ('bitcoin-price',), bitcoin_price_result, conditional_environ(request)))
+    except Exception as e:
+        logger.error(f"Erro ao obter preço do Bitcoin: {e}")
+        return json_response({
+            'success': False,
+            'error': str(e)
+        })
+
+@timed('data_status')
+async def data_status(request):
+    try:
+        return json_response(*await run_blocking(
+            conditional_result, ('data-status',), data_status_result, conditional_environ(request)))
+    except Exception as e:
+        return json_response({
+            'success': False,
+            'error': str(e)
+        })
+
+async def stream(request):
+    subscription = await run_blocking(price_publisher.subscribe, AsyncSubscription())
+
+    async def events():
+        try:
+            while True:
+                event = await subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                yield format_sse(event) if event else ': keepalive\n\n'
+        finally:
+            price_publisher.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+application = Starlette(routes=[
+    Route('/compare', compare, methods=['POST']),
+    Route('/bitcoin-price', bitcoin_price),
+    Route('/data-status', data_status),
+    Route('/stream', stream),
+    # Demais rotas (página, /timeseries, /simulate, /update-data, /metrics...)
+    Mount('/', app=WSGIMiddleware(flask_app)),
+])
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Servidor ASGI de produção')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Os workers herdam a variável e gravam suas métricas no diretório
+        directory = os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='btc-metrics-'))
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith('.json'):  # Valores de uma execução anterior
+                os.remove(os.path.join(directory, name))
+
+    print(f"🚀 Servindo em http://{args.host}:{args.port} com {args.workers} workers")
+    uvicorn.run('asgi:application', host=args.host, port=args.port,
+                workers=args.workers, reload=False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import csv
+import json
+import os
+
+# Tabelas onde cada tipo de ativo é armazenado
+STORAGE_TABLES = ('bitcoin_prices', 'stock_prices', 'index_prices')
+
+# Campos do registro de ativos e seus valores padrão
+ASSET_DEFAULTS = {
+    'name': None,
+    'source': 'yahoo',
+    'currency': 'BRL',
+    'storage': 'stock_prices',
+    'asset_type': 'stock',
+    'active': 1,
+    'sort_order': 0,
+}
+
+# Universo inicial (o mesmo que antes estava fixo no código)
+DEFAULT_ASSETS = [
+    {'symbol': 'BTC-USD', 'name': 'Bitcoin', 'currency': 'USD',
+     'storage': 'bitcoin_prices', 'asset_type': 'crypto', 'sort_order': 0},
+    {'symbol': 'BOVA11.SA', 'name': 'Ibovespa (BOVA11)', 'asset_type': 'etf', 'sort_order': 1},
+    {'symbol': 'PETR4.SA', 'name': 'Petrobras (PETR4)', 'sort_order': 2},
+    {'symbol': 'ITUB4.SA', 'name': 'Itaú (ITUB4)', 'sort_order': 3},
+    {'symbol': 'VALE3.SA', 'name': 'Vale (VALE3)', 'sort_order': 4},
+    {'symbol': 'BBAS3.SA', 'name': 'Banco do Brasil (BBAS3)', 'sort_order': 5},
+]
+
+
+def normalize_asset(record):
+    """Completa um registro de ativo com os valores padrão e o valida"""
+    if not record.get('symbol'):
+        raise ValueError(f"Ativo sem símbolo: {record}")
+
+    asset = dict(ASSET_DEFAULTS)
+    asset.update({k: v for k, v in record.items() if v not in (None, '')})
+    asset['symbol'] = asset['symbol'].strip()
+    asset['name'] = asset['name'] or asset['symbol']
+    asset['active'] = int(asset['active'])
+    asset['sort_order'] = int(asset['sort_order'])
+
+    if asset['storage'] not in STORAGE_TABLES:
+        raise ValueError(f"Tabela de armazenamento inválida para {asset['symbol']}: {asset['storage']}")
+    return asset
+
+
+def load_assets_file(path):
+    """Lê ativos de um arquivo JSON (lista de objetos) ou CSV (com cabeçalho)"""
+    if os.path.splitext(path)[1].lower() == '.json':
+        with open(path, encoding='utf-8') as f:
+            records = json.load(f)
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            records = list(csv.DictReader(f))
+    return [normalize_asset(record) for record in records]
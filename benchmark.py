@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Benchmark offline do sistema (sem acesso à rede)
+
+Gera anos de dados diários para vários símbolos (ou reproduz arquivos de
+replay), mede a vazão da ingestão, a latência do /compare e de uma varredura
+de carteiras no /portfolio (via cliente de teste do Flask), o uso de memória
+e a partida a frio do servidor web
+(importação do app e primeira requisição, em processos novos). Com
+--baseline, compara com uma execução anterior e termina com erro se alguma
+métrica piorar além da tolerância.
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from assets import DEFAULT_ASSETS
+from data_collector import DataCollector, BITCOIN_SYMBOL, USD_BRL_SYMBOL
+from data_sources import ReplaySource, synthetic_history
+
+# Métricas comparadas com a linha de base (True: maior é melhor)
+METRICS = {
+    'ingest_rows_per_second': True,
+    'ingest_seconds': False,
+    'incremental_noop_seconds': False,
+    'compare_cold_p50_ms': False,
+    'compare_cold_p95_ms': False,
+    'compare_cold_p99_ms': False,
+    'compare_warm_p50_ms': False,
+    'compare_warm_p95_ms': False,
+    'portfolio_sweep_ms': False,
+    'ingest_peak_memory_mb': False,
+    'startup_process_ms': False,
+    'startup_import_ms': False,
+    'startup_first_request_ms': False,
+}
+
+# Dependências da coleta que o servidor web não deveria importar
+COLLECTION_MODULES = ('pandas', 'yfinance', 'requests', 'bs4')
+
+# Executado em um processo novo para medir a partida a frio
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter()
+response = app.app.test_client().post('/compare', json={payload!r})
+finished = time.perf_counter()
+print(json.dumps({{
+    'import': imported - started,
+    'first_request': finished - imported,
+    'status': response.status_code,
+    'collection_modules': [m for m in {modules!r} if m in sys.modules]
+}}))
+"""
+
+
+def percentiles(samples, prefix):
+    """p50/p95/p99 (em ms) de uma lista de tempos em segundos"""
+    values = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+    return {f'{prefix}_p{p}_ms': round(float(v), 3) for p, v in zip((50, 95, 99), values)}
+
+
+def build_source(args, start_date, end_date):
+    """Fonte de replay: arquivos informados ou dados sintéticos"""
+    extra = [f'SYN{i:03d}.SA' for i in range(args.symbols)]
+    if args.fixtures:
+        return ReplaySource.from_path(args.fixtures), extra
+
+    symbols = [asset['symbol'] for asset in DEFAULT_ASSETS] + extra + [USD_BRL_SYMBOL]
+    frame = synthetic_history(symbols, start_date, end_date, daily_symbols=(BITCOIN_SYMBOL,), seed=args.seed)
+    return ReplaySource(frame), extra
+
+
+def bench_ingestion(args, results):
+    """Ingestão completa e uma atualização incremental sem novidades"""
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=365 * args.years)
+    source, extra = build_source(args, start_date, end_date)
+
+    collector = DataCollector('investment_data.db', source=source)
+    collector.save_assets([{'symbol': symbol, 'sort_order': 10 + i} for i, symbol in enumerate(extra)])
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    saved = collector.update_all_data(days=(end_date - start_date).days, incremental=False)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rows = saved['bitcoin_rows'] + saved['stock_rows'] + saved['index_rows']
+    results.update({
+        'ingest_rows': rows,
+        'ingest_seconds': round(elapsed, 3),
+        'ingest_rows_per_second': round(rows / elapsed, 1),
+        'ingest_peak_memory_mb': round(peak / 2 ** 20, 2),
+    })
+
+    started = time.perf_counter()
+    collector.update_all_data(days=7)
+    results['incremental_noop_seconds'] = round(time.perf_counter() - started, 3)
+    return start_date, end_date
+
+
+def bench_compare(args, results, start_date, end_date):
+    """Latência do /compare com o cache de respostas vazio e aquecido"""
+    import app
+
+    client = app.app.test_client()
+    rng = np.random.default_rng(args.seed)
+    span = (end_date - start_date).days
+    payloads = [{
+        'amount': 1000,
+        'start_date': (start_date + timedelta(days=int(rng.integers(30, span - 30)))).isoformat(),
+        'end_date': end_date.isoformat()
+    } for _ in range(args.requests)]
+
+    for name, clear in (('compare_cold', True), ('compare_warm', False)):
+        samples = []
+        for payload in payloads:
+            if clear:
+                app.response_cache.clear()
+            started = time.perf_counter()
+            response = client.post('/compare', json=payload)
+            samples.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"/compare respondeu {response.status_code}: {response.get_data(as_text=True)}")
+        results.update(percentiles(samples, name))
+
+
+def bench_portfolio(args, results, start_date, end_date):
+    """Varredura de alocações (passo de 10%) entre os ativos padrão no /portfolio"""
+    import app
+
+    symbols = [asset['symbol'] for asset in DEFAULT_ASSETS]
+    payload = {
+        'symbols': symbols, 'weight_step': 0.1, 'rebalance': 'monthly', 'cost_bps': 10,
+        'start_date': (start_date + timedelta(days=30)).isoformat(), 'end_date': end_date.isoformat()
+    }
+    client = app.app.test_client()
+    samples = []
+    for _ in range(5):
+        started = time.perf_counter()
+        response = client.post('/portfolio', json=payload)
+        samples.append(time.perf_counter() - started)
+        body = response.get_json()
+        if not body['success']:
+            raise RuntimeError(f"/portfolio falhou: {body['error']}")
+    results['portfolio_combinations'] = len(body['weights'])
+    results['portfolio_sweep_ms'] = round(float(np.median(samples)) * 1000, 1)
+
+
+def bench_startup(args, results, start_date, end_date):
+    """Partida a frio: processo, importação do app e primeira requisição"""
+    script = STARTUP_SCRIPT.format(
+        root=os.path.dirname(os.path.abspath(__file__)),
+        payload={'amount': 1000, 'start_date': (start_date + timedelta(days=30)).isoformat(),
+                 'end_date': end_date.isoformat()},
+        modules=COLLECTION_MODULES
+    )
+
+    samples = []
+    for _ in range(args.startup_runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+        run = json.loads(output.stdout.strip().splitlines()[-1])
+        run['process'] = time.perf_counter() - started
+        samples.append(run)
+
+    for name in ('process', 'import', 'first_request'):
+        results[f'startup_{name}_ms'] = round(float(np.median([run[name] for run in samples])) * 1000, 1)
+    results['startup_collection_modules'] = samples[-1]['collection_modules']
+
+
+def max_rss_mb():
+    """Pico de memória residente do processo (None fora de sistemas Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB; macOS em bytes
+    return round(rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 2)
+
+
+def find_regressions(results, baseline, tolerance):
+    """Lista as métricas que pioraram mais que `tolerance` (fração)"""
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        old, new = baseline.get(metric), results.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{metric}: {old} -> {new} ({change:+.0%})")
+    if results.get('startup_collection_modules'):
+        regressions.append(f"app importa dependências da coleta: {', '.join(results['startup_collection_modules'])}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark offline de ingestão, /compare e /portfolio')
+    parser.add_argument('--symbols', type=int, default=50, help='símbolos sintéticos além dos padrão')
+    parser.add_argument('--years', type=int, default=5, help='anos de histórico diário')
+    parser.add_argument('--requests', type=int, default=200, help='requisições ao /compare')
+    parser.add_argument('--startup-runs', type=int, default=5, help='processos para medir a partida')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixtures', help='arquivo ou diretório CSV/Parquet para replay')
+    parser.add_argument('--output', help='grava os resultados em JSON')
+    parser.add_argument('--baseline', help='resultados anteriores para comparação')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='piora aceita (fração)')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = {'symbols': args.symbols, 'years': args.years, 'requests': args.requests}
+
+    # Banco descartável; o app.py abre investment_data.db no diretório atual
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            start_date, end_date = bench_ingestion(args, results)
+            bench_compare(args, results, start_date, end_date)
+            bench_portfolio(args, results, start_date, end_date)
+            bench_startup(args, results, start_date, end_date)
+        finally:
+            os.chdir(cwd)
+    results['max_rss_mb'] = max_rss_mb()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regressões de desempenho:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("\n✅ Sem regressões em relação à linha de base")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,91 +1,455 @@
-import sqlite3
-import requests
-import pandas as pd
-import yfinance as yf
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone, date as date_cls
+import numpy as np
 import time
 import json
 import os
-from bs4 import BeautifulSoup
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from database import ConnectionManager
+from price_cache import PriceCache, to_datetime64, days_to_datetime64, MAX_STALENESS_DAYS
+from fx_rates import FxRates
+from price_stats import compute_stats, VOLATILITY_WINDOW
+from rate_limiter import TokenBucket, retry_with_backoff
+from data_sources import YahooSource
+from metrics import SOURCE_FETCH_SECONDS, SOURCE_ERRORS, SAVE_BATCH_SECONDS, ROWS_SAVED
+from assets import DEFAULT_ASSETS, ASSET_DEFAULTS, normalize_asset
+from intraday import INTERVALS, ROLLUP_RESOLUTIONS, BAR_FIELDS, aggregate_bars, choose_resolution
+from lazy_imports import LazyModule
+from locks import LeaseLock, LOCK_TTL_SECONDS
+
+# Dependências da coleta, carregadas no primeiro uso: o servidor web só lê o
+# banco e não precisa delas
+pd = LazyModule('pandas')
+requests = LazyModule('requests')
+bs4 = LazyModule('bs4')
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Chave usada para o Bitcoin nas consultas em lote
+BITCOIN_SYMBOL = 'BTC-USD'
+
+# Ticker da cotação USD/BRL no Yahoo Finance
+USD_BRL_SYMBOL = 'USDBRL=X'
+
+USD_BRL_FALLBACK_RATE = 5.2
+
+# Linhas por lote nas exportações (lidas do cursor e enviadas de uma vez)
+EXPORT_BATCH_SIZE = 50_000
+
+# Versão do esquema (PRAGMA user_version). Bancos antigos são migrados por
+# init_database; a versão 1 é o esquema original, com datas em texto, a 3
+# só acrescenta tabelas (histórico de coletas e locks) e a 4, a abertura,
+# máxima e mínima das barras intradiárias
+SCHEMA_VERSION = 4
+
+# Colunas das barras intradiárias na ordem de BAR_FIELDS (BRL); barras
+# gravadas antes da versão 4 do esquema só têm o fechamento
+INTRADAY_BAR_COLUMNS = ('ts, COALESCE(open_brl, price_brl), COALESCE(high_brl, price_brl), '
+                        'COALESCE(low_brl, price_brl), price_brl, volume')
+
+# Nome do lock que garante uma única coleta por vez entre os processos
+COLLECTION_LOCK = 'collection'
+
+# Colunas do histórico de coletas (tabela collection_runs)
+RUN_COLUMNS = (
+    'id', 'kind', 'trigger', 'days', 'scheduled_for', 'status', 'owner', 'started_at', 'finished_at',
+    'duration_seconds', 'bitcoin_rows', 'stock_rows', 'index_rows', 'stats_rows', 'error'
+)
+
+# Momento atual em segundos epoch (coluna updated_at das tabelas de preços)
+NOW_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+# Tabelas da versão 1 convertidas pela migração -> (tabela nova, colunas de
+# valores, coluna do símbolo ou, no Bitcoin, o símbolo fixo)
+LEGACY_TABLES = {
+    'bitcoin_prices': ('price_brl, price_usd, volume, market_cap', f"'{BITCOIN_SYMBOL}'"),
+    'stock_prices': ('price, volume', 't.symbol'),
+    'index_prices': ('value', 't.index_name'),
+    'price_stats': ('log_return, cum_index, volatility, rolling_max', 't.symbol'),
+}
+
+def placeholders(values):
+    """Placeholders para uma cláusula IN com `values`"""
+    return ','.join('?' * len(values))
+
+def to_date_str(date):
+    """Normaliza datas (datetime ou texto) para o formato do banco"""
+    return date.strftime('%Y-%m-%d') if isinstance(date, datetime) else date
+
+def to_day(date):
+    """Converte uma data (texto ou datetime) em dias desde 1970-01-01, a chave do banco"""
+    return int(np.datetime64(str(to_date_str(date))[:10], 'D').astype(np.int64))
+
+def to_days(dates):
+    """Converte várias datas em dias desde 1970-01-01 (inteiros do Python)"""
+    return to_datetime64(dates).astype(np.int64).tolist()
+
+def from_day(day):
+    """Converte dias desde 1970-01-01 de volta para 'YYYY-MM-DD'"""
+    return str(np.datetime64(int(day), 'D'))
+
+def records_to_rows(data, columns, defaults=None):
+    """Converte lista de dicts ou DataFrame em tuplas prontas para executemany"""
+    defaults = defaults or {}
+    if isinstance(data, pd.DataFrame):
+        frame = data.reindex(columns=columns)
+        for column, value in defaults.items():
+            frame[column] = frame[column].fillna(value)
+        # tolist() devolve tipos nativos do Python (o sqlite3 não aceita numpy.int64)
+        return list(zip(*(frame[column].tolist() for column in columns)))
+    return [tuple(record.get(column, defaults.get(column)) for column in columns) for record in data]
+
+def fetch_window(days, start_date=None, end_date=None):
+    """Retorna (início, fim exclusivo) para o yfinance a partir de `days` ou de datas explícitas"""
+    if start_date is None:
+        end = datetime.now()
+        return end - timedelta(days=days), end
+    end = end_date or datetime.now().date()
+    return start_date, end + timedelta(days=1)
+
+def expected_dates(start, end, daily=True):
+    """Datas (datetime64[D]) em que se espera um fechamento entre start e end, inclusive"""
+    dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    return dates if daily else dates[np.is_busday(dates)]
+
+def missing_runs(expected, stored, min_length=1):
+    """Agrupa as datas esperadas ausentes em intervalos (início, fim) consecutivos"""
+    missing = np.flatnonzero(~np.isin(expected, stored))
+    if not missing.size:
+        return []
+    breaks = np.flatnonzero(np.diff(missing) > 1)
+    starts = np.r_[missing[0], missing[breaks + 1]]
+    ends = np.r_[missing[breaks], missing[-1]]
+    return [(expected[a].item(), expected[b].item())
+            for a, b in zip(starts, ends) if b - a + 1 >= min_length]
+
+def history_to_frame(hist):
+    """Converte o histórico do yfinance em DataFrame com datas no formato do banco"""
+    hist = hist.dropna(subset=['Close'])
+    return pd.DataFrame({
+        'date': hist.index.strftime('%Y-%m-%d'),
+        'close': hist['Close'].to_numpy(dtype=float),
+        'volume': hist['Volume'].to_numpy(dtype=float),
+    })
+
+def index_to_epoch(index):
+    """Converte o índice de datas do yfinance em segundos epoch (UTC)"""
+    index = pd.DatetimeIndex(index)
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    return np.asarray((index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1), dtype=np.int64)
+
 class DataCollector:
-    def __init__(self, db_path='investment_data.db'):
+    def __init__(self, db_path='investment_data.db', use_cache=False,
+                 download_func=None, batch_size=50, requests_per_second=0.5,
+                 max_workers=8, source_timeout=120, source=None, init_db=True):
         self.db_path = db_path
-        self.init_database()
+        self.db = ConnectionManager(db_path)
+        # Processos que só leem (servidor web) pulam o DDL se o esquema já existe
+        if init_db or not self.schema_ready():
+            self.init_database()
+
+        # Fonte dos históricos (Yahoo Finance ou replay local); `download_func`
+        # troca só o download em lote (yf.download) por um stub
+        self.source = source or YahooSource(download_func)
+        self.batch_size = batch_size
+        # Fontes locais não precisam de limite de requisições
+        rate = requests_per_second if self.source.live else 1e6
+        self.rate_limiter = TokenBucket(rate, capacity=2)
+
+        # Coleta concorrente: número de fontes simultâneas e tempo limite de cada uma
+        self.max_workers = max_workers
+        self.source_timeout = source_timeout
+
+        # Série USD/BRL e registro de ativos em memória (carregados sob demanda)
+        self._fx = None
+        self._fx_updated_on = None  # Dia da última atualização USD/BRL do intradiário
+        self._assets = None
+        self._assets_version = None
+        self._symbol_ids = {}  # símbolo -> id na tabela symbols
+
+        # Chamados com (versão, última escrita) após cada gravação de preços
+        self._listeners = []
+
+        # Cache em memória dos preços (usado pelo servidor web)
+        self.cache = None
+        if use_cache:
+            self.cache = PriceCache(self)
+            self.cache.load()
 
     def init_database(self):
-        """Inicializa o banco de dados SQLite"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Cria o esquema ou migra um banco de versão anterior (PRAGMA user_version)"""
+        with self.db.transaction() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version < SCHEMA_VERSION:
+                self._migrate_compact(conn)
+            self._create_tables(conn.cursor())
+            if version < SCHEMA_VERSION:
+                self._migrate_intraday_ohlc(conn)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        logger.info("Banco de dados inicializado")
 
-        # Tabela para Bitcoin
+    def schema_ready(self):
+        """Indica se o banco já está na versão atual do esquema (só leitura)"""
+        return self.db.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+
+    def _migrate_compact(self, conn):
+        """Migra as tabelas da versão 1 (datas em texto) para o esquema compacto
+
+        As tabelas antigas são renomeadas e copiadas em lote com INSERT ...
+        SELECT, convertendo a data em dias desde 1970-01-01, o símbolo em
+        symbol_id e updated_at em epoch, na ordem da chave primária. Roda
+        dentro da transação de init_database: se falhar, nada muda. Bancos
+        novos (sem tabelas da versão 1) não têm o que migrar.
+        """
+        legacy = [table for table in LEGACY_TABLES
+                  if any(column[1] == 'date' for column in conn.execute(f'PRAGMA table_info({table})'))]
+        if not legacy:
+            return
+
+        started = time.monotonic()
+        conn.execute('DROP VIEW IF EXISTS all_prices')
+        for index in ('idx_stock_prices_symbol_date', 'idx_bitcoin_prices_date', 'idx_index_prices_name_date'):
+            conn.execute(f'DROP INDEX IF EXISTS {index}')
+        for table in legacy:
+            conn.execute(f'ALTER TABLE {table} RENAME TO {table}_v1')
+        self._create_tables(conn.cursor())
+
+        conn.execute(f"""
+            INSERT OR IGNORE INTO symbols (symbol)
+            {' UNION '.join(f'SELECT {LEGACY_TABLES[table][1]} FROM {table}_v1 t' for table in legacy)}
+        """)
+        for table in legacy:
+            values, symbol = LEGACY_TABLES[table]
+            cursor = conn.execute(f"""
+                INSERT OR IGNORE INTO {table} (symbol_id, day, {values}, updated_at)
+                SELECT s.id, CAST(julianday(t.date) - 2440587.5 AS INTEGER), {values},
+                       CAST(strftime('%s', t.updated_at) AS INTEGER)
+                FROM {table}_v1 t JOIN symbols s ON s.symbol = {symbol}
+                WHERE julianday(t.date) IS NOT NULL
+                ORDER BY 1, 2
+            """)
+            logger.info(f"Migradas {cursor.rowcount} linhas de {table}")
+            conn.execute(f'DROP TABLE {table}_v1')
+        logger.info(f"Esquema migrado para a versão {SCHEMA_VERSION} em {time.monotonic() - started:.1f}s")
+
+    def _migrate_intraday_ohlc(self, conn):
+        """Acrescenta abertura, máxima e mínima (BRL) às barras intradiárias
+
+        Barras gravadas antes da versão 4 ficam com NULL nessas colunas e
+        são lidas com o fechamento no lugar.
+        """
+        columns = {column[1] for column in conn.execute('PRAGMA table_info(bitcoin_intraday)')}
+        for column in ('open_brl', 'high_brl', 'low_brl'):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE bitcoin_intraday ADD COLUMN {column} REAL')
+
+    def _create_tables(self, cursor):
+        """Cria as tabelas, caso ainda não existam
+
+        As tabelas de preços usam chave (symbol_id, day) WITHOUT ROWID: as
+        linhas ficam agrupadas por símbolo e em ordem de data na própria
+        árvore da chave primária, sem índices secundários. `day` são dias
+        desde 1970-01-01 e updated_at, segundos epoch.
+        """
+
+        # Símbolos das tabelas de preços (ids estáveis: nunca são apagados)
         cursor.execute("""
+            CREATE TABLE IF NOT EXISTS symbols (
+                id INTEGER PRIMARY KEY,
+                symbol TEXT NOT NULL UNIQUE
+            )
+        """)
+
+        # Tabela para Bitcoin
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS bitcoin_prices (
-                date TEXT PRIMARY KEY,
+                symbol_id INTEGER,
+                day INTEGER,
                 price_brl REAL,
                 price_usd REAL,
                 volume REAL,
                 market_cap REAL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+                updated_at INTEGER DEFAULT ({NOW_SQL}),
+                PRIMARY KEY (symbol_id, day)
+            ) WITHOUT ROWID
         """)
 
         # Tabela para ações brasileiras
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS stock_prices (
-                date TEXT,
-                symbol TEXT,
+                symbol_id INTEGER,
+                day INTEGER,
                 price REAL,
                 volume REAL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (date, symbol)
-            )
+                updated_at INTEGER DEFAULT ({NOW_SQL}),
+                PRIMARY KEY (symbol_id, day)
+            ) WITHOUT ROWID
         """)
 
         # Tabela para índices (Ibovespa, IFIX, etc.)
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS index_prices (
-                date TEXT,
-                index_name TEXT,
+                symbol_id INTEGER,
+                day INTEGER,
                 value REAL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (date, index_name)
+                updated_at INTEGER DEFAULT ({NOW_SQL}),
+                PRIMARY KEY (symbol_id, day)
+            ) WITHOUT ROWID
+        """)
+
+        # Registro de ativos: o que é coletado, onde é armazenado e como é exibido
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS assets (
+                symbol TEXT PRIMARY KEY,
+                name TEXT,
+                source TEXT,
+                currency TEXT,
+                storage TEXT,
+                asset_type TEXT,
+                active INTEGER DEFAULT 1,
+                sort_order INTEGER DEFAULT 0
             )
         """)
+        cursor.executemany("""
+            INSERT OR IGNORE INTO assets (symbol, name, source, currency, storage, asset_type, active, sort_order)
+            VALUES (:symbol, :name, :source, :currency, :storage, :asset_type, :active, :sort_order)
+        """, [normalize_asset(asset) for asset in DEFAULT_ASSETS])
 
-        conn.commit()
-        conn.close()
-        logger.info("Banco de dados inicializado")
+        # Todas as tabelas de preços com o mesmo formato (símbolo, dia, preço em BRL)
+        cursor.execute("""
+            CREATE VIEW IF NOT EXISTS all_prices AS
+            SELECT symbol_id, day, price_brl AS price, updated_at FROM bitcoin_prices
+            UNION ALL
+            SELECT symbol_id, day, price, updated_at FROM stock_prices
+            UNION ALL
+            SELECT symbol_id, day, value, updated_at FROM index_prices
+        """)
 
-    def get_bitcoin_data_yahoo(self, days=30):
-        """Coleta dados do Bitcoin via Yahoo Finance"""
-        try:
-            btc = yf.Ticker("BTC-USD")
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=days)
+        # Cotações diárias USD/BRL
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS fx_rates (
+                date TEXT PRIMARY KEY,
+                rate REAL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
 
-            hist = btc.history(start=start_date, end=end_date)
+        # Bitcoin intradiário: uma linha por barra, chave epoch em segundos (UTC).
+        # INTEGER PRIMARY KEY é o próprio rowid, sem índice separado.
+        # price_usd/price_brl são o fechamento da barra
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bitcoin_intraday (
+                ts INTEGER PRIMARY KEY,
+                price_usd REAL,
+                price_brl REAL,
+                volume REAL,
+                open_brl REAL,
+                high_brl REAL,
+                low_brl REAL
+            )
+        """)
 
-            if hist.empty:
-                logger.warning("Nenhum dado do Bitcoin obtido via Yahoo Finance")
-                return None
+        # Agregações OHLC do intradiário (resolução em segundos: hora e dia)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bitcoin_rollups (
+                resolution INTEGER,
+                ts INTEGER,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume REAL,
+                PRIMARY KEY (resolution, ts)
+            ) WITHOUT ROWID
+        """)
 
-            # Converter USD para BRL (aproximação usando taxa atual)
-            usd_brl_rate = self.get_usd_brl_rate()
+        # Estatísticas derivadas por símbolo e data (materializadas após cada coleta)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS price_stats (
+                symbol_id INTEGER,
+                day INTEGER,
+                log_return REAL,
+                cum_index REAL,
+                volatility REAL,
+                rolling_max REAL,
+                updated_at INTEGER DEFAULT ({NOW_SQL}),
+                PRIMARY KEY (symbol_id, day)
+            ) WITHOUT ROWID
+        """)
 
-            bitcoin_data = []
-            for date, row in hist.iterrows():
-                bitcoin_data.append({
-                    'date': date.strftime('%Y-%m-%d'),
-                    'price_usd': row['Close'],
-                    'price_brl': row['Close'] * usd_brl_rate,
-                    'volume': row['Volume']
-                })
+        # Metadados (ex.: versão dos dados, incrementada a cada escrita)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+        """)
+
+        # Histórico de coletas: quem pediu, janela, duração e linhas gravadas
+        # (status: queued, running, done, failed ou skipped quando outra já rodava)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS collection_runs (
+                id INTEGER PRIMARY KEY,
+                kind TEXT,
+                trigger TEXT,
+                days INTEGER,
+                scheduled_for INTEGER,
+                status TEXT,
+                owner TEXT,
+                started_at INTEGER,
+                finished_at INTEGER,
+                duration_seconds REAL,
+                bitcoin_rows INTEGER,
+                stock_rows INTEGER,
+                index_rows INTEGER,
+                stats_rows INTEGER,
+                error TEXT
+            )
+        """)
+
+        # Locks entre processos com prazo (ver locks.LeaseLock)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT,
+                acquired_at INTEGER,
+                expires_at INTEGER
+            )
+        """)
+
+    def fetch_bitcoin_history(self, days=30, start_date=None, end_date=None):
+        """Baixa o histórico do Bitcoin em USD da fonte de dados"""
+        start, end = fetch_window(days, start_date, end_date)
+
+        self.rate_limiter.acquire()
+        with SOURCE_FETCH_SECONDS.time(source='bitcoin'):
+            hist = self.source.history(BITCOIN_SYMBOL, start, end)
+
+        if hist.empty:
+            logger.warning("Nenhum dado do Bitcoin obtido via Yahoo Finance")
+            return None
+
+        frame = history_to_frame(hist)
+        return pd.DataFrame({
+            'date': frame['date'],
+            'price_usd': frame['close'],
+            'volume': frame['volume']
+        })
+
+    def get_bitcoin_data_yahoo(self, days=30, usd_brl_rate=None):
+        """Coleta dados do Bitcoin via Yahoo Finance"""
+        try:
+            bitcoin_data = self.fetch_bitcoin_history(days)
+            if bitcoin_data is None:
+                return None
+
+            # Converter USD para BRL com a cotação de cada dia (ou a taxa informada)
+            if usd_brl_rate is None:
+                self.update_fx_rates(date_cls.fromisoformat(bitcoin_data['date'].min()))
+            self._convert_bitcoin_to_brl(bitcoin_data, usd_brl_rate)
 
             logger.info(f"Coletados {len(bitcoin_data)} registros do Bitcoin")
             return bitcoin_data
@@ -94,49 +458,170 @@ class DataCollector:
             logger.error(f"Erro ao coletar dados do Bitcoin: {e}")
             return None
 
-    def get_usd_brl_rate(self):
-        """Obtém taxa USD/BRL atual"""
+    def get_usd_brl_rate(self, date=None):
+        """Obtém taxa USD/BRL do dia (ou a mais recente) da série armazenada"""
+        fx = self.get_fx_rates()
+        if len(fx):
+            return fx.rate_on(date)
+
+        # Sem série local: consulta a taxa atual
         try:
-            usd_brl = yf.Ticker("USDBRL=X")
-            rate = usd_brl.history(period="1d")['Close'].iloc[-1]
-            return rate
+            start, end = fetch_window(5)
+            return self.source.history(USD_BRL_SYMBOL, start, end)['Close'].iloc[-1]
         except:
-            return 5.2  # Taxa de fallback
+            return USD_BRL_FALLBACK_RATE  # Taxa de fallback
 
-    def get_stock_data(self, symbols, days=30):
-        """Coleta dados de ações brasileiras"""
-        stock_data = []
+    def get_fx_rates(self):
+        """Retorna a série USD/BRL em memória, carregando-a do banco se preciso"""
+        if self._fx is None:
+            rows = self.db.execute('SELECT date, rate FROM fx_rates ORDER BY date').fetchall()
+            self._fx = FxRates([r[0] for r in rows], [r[1] for r in rows])
+        return self._fx
 
-        for symbol in symbols:
-            try:
-                ticker = yf.Ticker(symbol)
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=days)
+    def save_fx_rates(self, data):
+        """Salva cotações USD/BRL (DataFrame ou lista de dicts com date e rate)"""
+        if data is None or len(data) == 0:
+            return
 
-                hist = ticker.history(start=start_date, end=end_date)
+        rows = records_to_rows(data, ['date', 'rate'])
+        with SAVE_BATCH_SECONDS.time(table='fx_rates'), self.db.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO fx_rates (date, rate) VALUES (?, ?)
+                ON CONFLICT(date) DO UPDATE SET
+                    rate = excluded.rate,
+                    updated_at = CURRENT_TIMESTAMP
+            """, rows)
+            ROWS_SAVED.inc(len(rows), table='fx_rates')
+        self._fx = None
+        logger.info(f"Salvas {len(rows)} cotações USD/BRL")
 
-                if hist.empty:
-                    logger.warning(f"Nenhum dado obtido para {symbol}")
-                    continue
+    def fx_ranges(self, start_date=None, days=30):
+        """Intervalos que faltam para completar a série USD/BRL a partir de start_date
+
+        Só o trecho anterior ao início da série e o posterior à última
+        cotação gravada (que é buscada de novo, pois pode ser parcial).
+        """
+        today = datetime.now().date()
+        start_date = start_date or today - timedelta(days=days)
+        first_date, last_date = self.db.execute('SELECT MIN(date), MAX(date) FROM fx_rates').fetchone()
+
+        if first_date is None:
+            return [(start_date, today)]
+        first = date_cls.fromisoformat(first_date)
+        ranges = [(date_cls.fromisoformat(last_date), today)]
+        if start_date < first:
+            ranges.append((start_date, first - timedelta(days=1)))
+        return ranges
+
+    def fetch_fx_rates(self, ranges):
+        """Baixa as cotações USD/BRL dos intervalos (DataFrame date/rate ou None)
+
+        Não acessa o banco: pode rodar nas threads de coleta.
+        """
+        frames = []
+        for start, end in ranges:
+            fetch_start, fetch_end = fetch_window(None, start, end)
+            self.rate_limiter.acquire()
+            with SOURCE_FETCH_SECONDS.time(source='usd_brl'):
+                hist = self.source.history(USD_BRL_SYMBOL, fetch_start, fetch_end)
+            if not hist.empty:
+                frame = history_to_frame(hist)
+                frames.append(pd.DataFrame({'date': frame['date'], 'rate': frame['close']}))
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def update_fx_rates(self, start_date=None, days=30):
+        """Completa a série USD/BRL a partir de start_date (ou dos últimos `days` dias)"""
+        self.save_fx_rates(self.fetch_fx_rates(self.fx_ranges(start_date, days)))
+        return self.get_fx_rates()
+
+    def _convert_bitcoin_to_brl(self, bitcoin_data, usd_brl_rate=None):
+        """Preenche price_brl com a cotação de cada data (ou uma taxa fixa)"""
+        fx = self.get_fx_rates()
+        if usd_brl_rate is None and len(fx):
+            bitcoin_data['price_brl'] = fx.convert(bitcoin_data['date'], bitcoin_data['price_usd'])
+        else:
+            rate = usd_brl_rate if usd_brl_rate is not None else self.get_usd_brl_rate()
+            bitcoin_data['price_brl'] = bitcoin_data['price_usd'] * rate
+
+    def recompute_bitcoin_brl(self):
+        """Recalcula price_brl de todo o histórico com a cotação de cada dia
 
-                for date, row in hist.iterrows():
-                    stock_data.append({
-                        'date': date.strftime('%Y-%m-%d'),
-                        'symbol': symbol,
-                        'price': row['Close'],
-                        'volume': row['Volume']
-                    })
+        Usa a última cotação até a data (ou a primeira da série, para datas
+        anteriores a ela), sem baixar preços novamente.
+        """
+        with self.db.transaction() as conn:
+            cursor = conn.execute(f"""
+                UPDATE bitcoin_prices SET
+                    price_brl = price_usd * COALESCE(
+                        (SELECT rate FROM fx_rates f WHERE f.date <= date(bitcoin_prices.day * 86400, 'unixepoch')
+                         ORDER BY f.date DESC LIMIT 1),
+                        (SELECT rate FROM fx_rates ORDER BY date LIMIT 1)
+                    ),
+                    updated_at = ?
+                WHERE price_usd IS NOT NULL AND EXISTS (SELECT 1 FROM fx_rates)
+            """, (self._price_stamp(conn),))
+            updated = cursor.rowcount
+            self._bump_data_version(conn)
 
-                logger.info(f"Coletados dados para {symbol}")
-                time.sleep(1)  # Evitar rate limiting
+        if self.cache is not None:
+            self.cache.load()
+        logger.info(f"Recalculados {updated} preços do Bitcoin em BRL")
+        return updated
 
+    def get_stock_data(self, symbols, days=30, batch_size=None, start_date=None, end_date=None):
+        """Coleta dados de ações brasileiras
+
+        Os símbolos são baixados em lotes de `batch_size` com uma única
+        chamada por lote, respeitando o limitador de taxa. O período é
+        `days` até hoje ou, se informado, de `start_date` a `end_date`.
+        """
+        batch_size = batch_size or self.batch_size
+        start, end = fetch_window(days, start_date, end_date)
+        frames = []
+
+        for i in range(0, len(symbols), batch_size):
+            chunk = list(symbols[i:i + batch_size])
+            try:
+                self.rate_limiter.acquire()
+                with SOURCE_FETCH_SECONDS.time(source='assets'):
+                    hist = retry_with_backoff(lambda: self.source.download(chunk, start, end))
             except Exception as e:
-                logger.error(f"Erro ao coletar dados de {symbol}: {e}")
+                SOURCE_ERRORS.inc(source='assets')
+                logger.error(f"Erro ao coletar dados de {', '.join(chunk)}: {e}")
                 continue
 
-        return stock_data
+            for symbol in chunk:
+                symbol_hist = self._select_symbol(hist, symbol)
+                if symbol_hist is None or symbol_hist.empty:
+                    logger.warning(f"Nenhum dado obtido para {symbol}")
+                    continue
+
+                frame = history_to_frame(symbol_hist)
+                frames.append(pd.DataFrame({
+                    'date': frame['date'],
+                    'symbol': symbol,
+                    'price': frame['close'],
+                    'volume': frame['volume']
+                }))
+
+            logger.info(f"Coletados dados para {len(chunk)} símbolos")
+
+        if not frames:
+            return pd.DataFrame(columns=['date', 'symbol', 'price', 'volume'])
+        return pd.concat(frames, ignore_index=True)
 
-    def scrape_bitcoin_coinmarketcap(self):
+    @staticmethod
+    def _select_symbol(hist, symbol):
+        """Extrai o histórico de um símbolo do resultado de yf.download"""
+        if hist is None or hist.empty:
+            return None
+        if isinstance(hist.columns, pd.MultiIndex):
+            if symbol not in hist.columns.get_level_values(0):
+                return None
+            return hist[symbol]
+        return hist
+
+    def scrape_bitcoin_coinmarketcap(self, usd_brl_rate=None):
         """Scraping alternativo do CoinMarketCap (método de backup)"""
         try:
             headers = {
@@ -144,10 +629,11 @@ class DataCollector:
             }
 
             url = "https://coinmarketcap.com/currencies/bitcoin/"
-            response = requests.get(url, headers=headers, timeout=10)
+            with SOURCE_FETCH_SECONDS.time(source='coinmarketcap'):
+                response = requests.get(url, headers=headers, timeout=10)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
+                soup = bs4.BeautifulSoup(response.content, 'html.parser')
 
                 # Tentar extrair preço atual (estrutura pode mudar)
                 price_element = soup.find('span', class_='sc-f70bb44c-0')
@@ -155,7 +641,8 @@ class DataCollector:
                     price_text = price_element.text.replace('$', '').replace(',', '')
                     price_usd = float(price_text)
 
-                    usd_brl_rate = self.get_usd_brl_rate()
+                    if usd_brl_rate is None:
+                        usd_brl_rate = self.get_usd_brl_rate()
                     price_brl = price_usd * usd_brl_rate
 
                     return {
@@ -169,115 +656,999 @@ class DataCollector:
 
         return None
 
+    def read_data_state(self):
+        """Lê do banco (versão, momento da última escrita em epoch) dos dados"""
+        state = dict(self.db.execute(
+            "SELECT key, value FROM data_meta WHERE key IN ('data_version', 'data_updated_at')"
+        ).fetchall())
+        return state.get('data_version', 0), state.get('data_updated_at')
+
+    def get_data_state(self):
+        """Retorna (versão, última escrita); usa o cache em memória, se houver"""
+        if self.cache is not None:
+            self.cache.refresh()
+            return self.cache.version, self.cache.updated_at
+        return self.read_data_state()
+
+    def add_listener(self, callback):
+        """Registra `callback(state)`, chamado após cada gravação de preços"""
+        self._listeners.append(callback)
+
+    def _notify(self, state):
+        for callback in self._listeners:
+            try:
+                callback(state)
+            except Exception as e:
+                logger.error(f"Erro ao notificar gravação: {e}")
+
+    def get_data_version(self):
+        """Retorna o contador de versão dos dados (muda a cada escrita)"""
+        return self.get_data_state()[0]
+
+    def _bump_data_version(self, conn):
+        conn.execute("""
+            INSERT INTO data_meta (key, value) VALUES ('data_version', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1
+        """)
+        conn.execute("""
+            INSERT INTO data_meta (key, value) VALUES ('data_updated_at', CAST(strftime('%s', 'now') AS INTEGER))
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """)
+        return self.read_data_state()
+
+    def _price_stamp(self, conn):
+        """updated_at das linhas de preço gravadas na transação de `conn`
+
+        O relógio em segundos, mas sempre depois da marca de materialize_stats:
+        linhas gravadas no mesmo segundo em que ela foi definida ainda
+        contam como pendentes.
+        """
+        return conn.execute(f"""
+            SELECT MAX({NOW_SQL}, COALESCE((SELECT value FROM data_meta WHERE key = 'stats_watermark'), 0) + 1)
+        """).fetchone()[0]
+
+    def get_assets(self, active_only=True):
+        """Retorna o registro de ativos (dicts), na ordem de exibição
+
+        O registro é recarregado quando a versão dos dados muda (save_assets
+        a incrementa), inclusive por cadastros feitos em outros processos.
+        """
+        version = self.get_data_version()
+        if self._assets is None or self._assets_version != version:
+            self._assets_version = version
+            cursor = self.db.execute("""
+                SELECT symbol, name, source, currency, storage, asset_type, active, sort_order
+                FROM assets ORDER BY sort_order, symbol
+            """)
+            columns = [c[0] for c in cursor.description]
+            self._assets = [dict(zip(columns, row)) for row in cursor]
+        return [a for a in self._assets if a['active'] or not active_only]
+
+    def get_asset_map(self):
+        """Retorna {símbolo: ativo} de todo o registro (para consultar vários de uma vez)"""
+        return {asset['symbol']: asset for asset in self.get_assets(active_only=False)}
+
+    def get_asset(self, symbol):
+        """Retorna o registro de um ativo ou None"""
+        return self.get_asset_map().get(symbol)
+
+    def save_assets(self, records):
+        """Cadastra ou atualiza ativos no registro"""
+        assets = [normalize_asset(record) for record in records]
+        with self.db.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO assets (symbol, name, source, currency, storage, asset_type, active, sort_order)
+                VALUES (:symbol, :name, :source, :currency, :storage, :asset_type, :active, :sort_order)
+                ON CONFLICT(symbol) DO UPDATE SET
+                    name = excluded.name,
+                    source = excluded.source,
+                    currency = excluded.currency,
+                    storage = excluded.storage,
+                    asset_type = excluded.asset_type,
+                    active = excluded.active,
+                    sort_order = excluded.sort_order
+            """, assets)
+            self._bump_data_version(conn)
+        self._assets = None
+        logger.info(f"Registrados {len(assets)} ativos")
+
+    def symbol_ids(self, symbols, create=False):
+        """Retorna {símbolo: id} da tabela symbols
+
+        Com `create`, cadastra os símbolos ausentes; deve ser chamado dentro
+        da transação de escrita que vai usá-los. Só ids já gravados ficam na
+        memória: os criados na transação corrente podem ser desfeitos.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        missing = [s for s in symbols if s not in self._symbol_ids]
+        if missing:
+            self._symbol_ids.update(self.db.execute(
+                f"SELECT symbol, id FROM symbols WHERE symbol IN ({placeholders(missing)})", missing))
+        ids = {s: self._symbol_ids[s] for s in symbols if s in self._symbol_ids}
+
+        new = [s for s in symbols if s not in ids]
+        if create and new:
+            conn = self.db.connection()
+            conn.executemany('INSERT OR IGNORE INTO symbols (symbol) VALUES (?)', [(s,) for s in new])
+            ids.update(conn.execute(f"SELECT symbol, id FROM symbols WHERE symbol IN ({placeholders(new)})", new))
+        return ids
+
+    def symbol_names(self):
+        """Retorna {id: símbolo} de todos os símbolos gravados"""
+        self._symbol_ids.update(self.db.execute('SELECT symbol, id FROM symbols'))
+        return {symbol_id: symbol for symbol, symbol_id in self._symbol_ids.items()}
+
+    def iter_price_rows(self, since=None):
+        """Itera (símbolo, dia, preço, updated_at) de todas as tabelas de preços
+
+        O dia é contado desde 1970-01-01. Com `since`, retorna apenas linhas
+        gravadas a partir desse updated_at (epoch).
+        """
+        where = 'WHERE p.updated_at >= ?' if since else ''
+        return self.db.execute(f"""
+            SELECT s.symbol, p.day, p.price, p.updated_at
+            FROM all_prices p JOIN symbols s ON s.id = p.symbol_id {where}
+            ORDER BY p.symbol_id, p.day
+        """, [since] if since else [])
+
     def save_bitcoin_data(self, data):
-        """Salva dados do Bitcoin no banco"""
-        if not data:
+        """Salva dados do Bitcoin no banco (lista de dicts ou DataFrame)"""
+        if data is None or len(data) == 0:
             return
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        rows = records_to_rows(data, ['date', 'price_brl', 'price_usd', 'volume'], {'volume': 0})
+        days = to_days(r[0] for r in rows)
 
-        for record in data:
-            cursor.execute("""
-                INSERT OR REPLACE INTO bitcoin_prices 
-                (date, price_brl, price_usd, volume) 
-                VALUES (?, ?, ?, ?)
-            """, (record['date'], record['price_brl'], 
-                  record['price_usd'], record.get('volume', 0)))
+        with SAVE_BATCH_SECONDS.time(table='bitcoin_prices'), self.db.transaction() as conn:
+            symbol_id = self.symbol_ids([BITCOIN_SYMBOL], create=True)[BITCOIN_SYMBOL]
+            stamp = self._price_stamp(conn)
+            conn.executemany("""
+                INSERT INTO bitcoin_prices (symbol_id, day, price_brl, price_usd, volume, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(symbol_id, day) DO UPDATE SET
+                    price_brl = excluded.price_brl,
+                    price_usd = excluded.price_usd,
+                    volume = excluded.volume,
+                    updated_at = excluded.updated_at
+            """, ((symbol_id, day, *row[1:], stamp) for day, row in zip(days, rows)))
+            ROWS_SAVED.inc(len(rows), table='bitcoin_prices')
+            state = self._bump_data_version(conn)
 
-        conn.commit()
-        conn.close()
-        logger.info(f"Salvos {len(data)} registros do Bitcoin")
+        if self.cache is not None:
+            self.cache.apply(BITCOIN_SYMBOL, [r[0] for r in rows], [r[1] for r in rows], state)
+        self._notify(state)
+        logger.info(f"Salvos {len(rows)} registros do Bitcoin")
 
     def save_stock_data(self, data):
-        """Salva dados de ações no banco"""
-        if not data:
+        """Salva dados de ações no banco (lista de dicts ou DataFrame)"""
+        if data is None or len(data) == 0:
+            return
+
+        rows = records_to_rows(data, ['date', 'symbol', 'price', 'volume'], {'volume': 0})
+        days = to_days(r[0] for r in rows)
+
+        with SAVE_BATCH_SECONDS.time(table='stock_prices'), self.db.transaction() as conn:
+            ids = self.symbol_ids([r[1] for r in rows], create=True)
+            stamp = self._price_stamp(conn)
+            conn.executemany("""
+                INSERT INTO stock_prices (symbol_id, day, price, volume, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(symbol_id, day) DO UPDATE SET
+                    price = excluded.price,
+                    volume = excluded.volume,
+                    updated_at = excluded.updated_at
+            """, ((ids[symbol], day, price, volume, stamp) for day, (_, symbol, price, volume) in zip(days, rows)))
+            ROWS_SAVED.inc(len(rows), table='stock_prices')
+            state = self._bump_data_version(conn)
+
+        if self.cache is not None:
+            by_symbol = {}
+            for date, symbol, price, _ in rows:
+                dates, prices = by_symbol.setdefault(symbol, ([], []))
+                dates.append(date)
+                prices.append(price)
+            for symbol, (dates, prices) in by_symbol.items():
+                self.cache.apply(symbol, dates, prices, state)
+        self._notify(state)
+        logger.info(f"Salvos {len(rows)} registros de ações")
+
+    def save_index_data(self, data):
+        """Salva dados de índices no banco (lista de dicts ou DataFrame com symbol e price)"""
+        if data is None or len(data) == 0:
             return
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        rows = records_to_rows(data, ['date', 'symbol', 'price'])
+        days = to_days(r[0] for r in rows)
 
-        for record in data:
-            cursor.execute("""
-                INSERT OR REPLACE INTO stock_prices 
-                (date, symbol, price, volume) 
+        with SAVE_BATCH_SECONDS.time(table='index_prices'), self.db.transaction() as conn:
+            ids = self.symbol_ids([r[1] for r in rows], create=True)
+            stamp = self._price_stamp(conn)
+            conn.executemany("""
+                INSERT INTO index_prices (symbol_id, day, value, updated_at)
                 VALUES (?, ?, ?, ?)
-            """, (record['date'], record['symbol'], 
-                  record['price'], record.get('volume', 0)))
+                ON CONFLICT(symbol_id, day) DO UPDATE SET
+                    value = excluded.value,
+                    updated_at = excluded.updated_at
+            """, ((ids[symbol], day, price, stamp) for day, (_, symbol, price) in zip(days, rows)))
+            ROWS_SAVED.inc(len(rows), table='index_prices')
+            state = self._bump_data_version(conn)
 
-        conn.commit()
-        conn.close()
-        logger.info(f"Salvos {len(data)} registros de ações")
+        if self.cache is not None:
+            by_symbol = {}
+            for date, symbol, price in rows:
+                dates, prices = by_symbol.setdefault(symbol, ([], []))
+                dates.append(date)
+                prices.append(price)
+            for symbol, (dates, prices) in by_symbol.items():
+                self.cache.apply(symbol, dates, prices, state)
+        self._notify(state)
+        logger.info(f"Salvos {len(rows)} registros de índices")
 
-    def get_bitcoin_price(self, date=None):
-        """Obtém preço do Bitcoin do banco local"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def fetch_bitcoin_intraday(self, interval='5m', start=None, end=None):
+        """Baixa barras intradiárias do Bitcoin (USD) entre start e end (exclusivo)
 
-        if date:
-            date_str = date.strftime('%Y-%m-%d') if isinstance(date, datetime) else date
-            cursor.execute('SELECT price_brl FROM bitcoin_prices WHERE date = ?', (date_str,))
+        O Yahoo Finance só guarda barras de 1 minuto dos últimos 7 dias e as
+        demais dos últimos 60.
+        """
+        self.rate_limiter.acquire()
+        with SOURCE_FETCH_SECONDS.time(source='bitcoin_intraday'):
+            hist = self.source.history(BITCOIN_SYMBOL, start, end, interval=interval)
+
+        if hist.empty:
+            logger.warning("Nenhuma barra intradiária do Bitcoin obtida")
+            return None
+
+        hist = hist.dropna(subset=['Close'])
+        close = hist['Close'].to_numpy(dtype=float)
+        return pd.DataFrame({
+            'ts': index_to_epoch(hist.index),
+            # Fontes só com fechamento (ex.: replay) repetem-no na abertura, máxima e mínima
+            **{f'{field}_usd': hist[column].to_numpy(dtype=float) if column in hist else close
+               for field, column in (('open', 'Open'), ('high', 'High'), ('low', 'Low'))},
+            'price_usd': close,
+            'volume': hist['Volume'].to_numpy(dtype=float),
+        })
+
+    def save_bitcoin_intraday(self, data):
+        """Salva barras intradiárias e atualiza as agregações
+
+        Cada barra tem ts, price_usd (fechamento) e volume, e opcionalmente
+        price_brl e abertura/máxima/mínima em USD (open_usd...) ou já em BRL
+        (open_brl...). Sem elas, a barra é um único preço.
+        """
+        if data is None or len(data) == 0:
+            return 0
+
+        frame = pd.DataFrame(data)
+        if 'price_brl' not in frame or frame['price_brl'].isna().any():
+            # Cotação USD/BRL do dia (UTC) de cada barra
+            frame['date'] = (frame['ts'].to_numpy(np.int64) // 86400).astype('datetime64[D]').astype(str)
+            self._convert_bitcoin_to_brl(frame)
+        rate = frame['price_brl'] / frame['price_usd']
+        for field in ('open', 'high', 'low'):
+            if f'{field}_brl' not in frame:
+                frame[f'{field}_brl'] = frame[f'{field}_usd'] * rate if f'{field}_usd' in frame else frame['price_brl']
+        rows = records_to_rows(frame, ['ts', 'price_usd', 'price_brl', 'volume', 'open_brl', 'high_brl', 'low_brl'],
+                               {'volume': 0})
+
+        with SAVE_BATCH_SECONDS.time(table='bitcoin_intraday'), self.db.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO bitcoin_intraday (ts, price_usd, price_brl, volume, open_brl, high_brl, low_brl)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ts) DO UPDATE SET
+                    price_usd = excluded.price_usd,
+                    price_brl = excluded.price_brl,
+                    volume = excluded.volume,
+                    open_brl = excluded.open_brl,
+                    high_brl = excluded.high_brl,
+                    low_brl = excluded.low_brl
+            """, rows)
+            ROWS_SAVED.inc(len(rows), table='bitcoin_intraday')
+            self._rollup_intraday(conn, min(r[0] for r in rows), max(r[0] for r in rows))
+
+        logger.info(f"Salvas {len(rows)} barras intradiárias do Bitcoin")
+        return len(rows)
+
+    def _rollup_intraday(self, conn, start_ts, end_ts):
+        """Recalcula as agregações dos dias (UTC) que contêm start_ts..end_ts"""
+        day = ROLLUP_RESOLUTIONS[-1]
+        rows = conn.execute(f"""
+            SELECT {INTRADAY_BAR_COLUMNS} FROM bitcoin_intraday
+            WHERE ts >= ? AND ts < ? AND price_brl IS NOT NULL ORDER BY ts
+        """, (start_ts // day * day, end_ts // day * day + day)).fetchall()
+        if not rows:
+            return
+
+        columns = [np.array(column) for column in zip(*rows)]
+        for resolution in ROLLUP_RESOLUTIONS:
+            bars = aggregate_bars(*columns, resolution)
+            conn.executemany("""
+                INSERT INTO bitcoin_rollups (resolution, ts, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(resolution, ts) DO UPDATE SET
+                    open = excluded.open,
+                    high = excluded.high,
+                    low = excluded.low,
+                    close = excluded.close,
+                    volume = excluded.volume
+            """, [(resolution, *bar) for bar in zip(*(values.tolist() for values in bars))])
+
+    def update_bitcoin_intraday(self, interval='5m', days=1):
+        """Completa as barras intradiárias a partir da última gravada (ou de `days` dias)
+
+        A última barra é buscada de novo, pois pode estar incompleta. Se a
+        fonte não responder, grava o preço atual do scraping como uma barra
+        no instante da coleta, sem sobrescrever o fechamento diário. A série
+        USD/BRL é completada no máximo uma vez por dia (as cotações são
+        diárias).
+        """
+        step = INTERVALS[interval]
+        now = int(time.time())
+        last_ts = self.db.execute('SELECT MAX(ts) FROM bitcoin_intraday').fetchone()[0]
+        start_ts = max(last_ts - step, now - days * 86400) if last_ts else now - days * 86400
+        start = datetime.fromtimestamp(start_ts, timezone.utc)
+        end = datetime.fromtimestamp(now + step, timezone.utc)
+
+        today = datetime.now().date()
+        if self._fx_updated_on != today:
+            self._fx_updated_on = today
+            try:
+                self.update_fx_rates(start.date())
+            except Exception as e:
+                # A série já gravada continua sendo usada
+                logger.error(f"Erro ao atualizar USD/BRL: {e}")
+
+        try:
+            bars = self.fetch_bitcoin_intraday(interval, start, end)
+        except Exception as e:
+            SOURCE_ERRORS.inc(source='bitcoin_intraday')
+            logger.error(f"Erro ao coletar barras intradiárias do Bitcoin: {e}")
+            bars = None
+
+        if bars is None and self.source.live:
+            scraped = self.scrape_bitcoin_coinmarketcap()
+            if scraped:
+                bars = pd.DataFrame([{
+                    'ts': now, 'price_usd': scraped['price_usd'],
+                    'price_brl': scraped['price_brl'], 'volume': 0
+                }])
+        return self.save_bitcoin_intraday(bars)
+
+    def get_bitcoin_intraday(self, start_ts, end_ts, max_points=500, base_resolution=INTERVALS['5m']):
+        """Barras OHLC (BRL) do Bitcoin entre start_ts e end_ts, com no máximo ~max_points
+
+        Lê das barras brutas ou da agregação horária/diária mais adequada e,
+        se ainda houver pontos demais, reagrupa na leitura. Retorna
+        ({campo: array} na ordem de BAR_FIELDS, passo em segundos ou None
+        para as barras brutas).
+        """
+        resolution, step = choose_resolution(start_ts, end_ts, max_points, base_resolution)
+        if resolution:
+            rows = self.db.execute("""
+                SELECT ts, open, high, low, close, volume FROM bitcoin_rollups
+                WHERE resolution = ? AND ts >= ? AND ts < ? ORDER BY ts
+            """, (resolution, start_ts // resolution * resolution, end_ts)).fetchall()
         else:
-            cursor.execute('SELECT price_brl FROM bitcoin_prices ORDER BY date DESC LIMIT 1')
+            rows = self.db.execute(f"""
+                SELECT {INTRADAY_BAR_COLUMNS} FROM bitcoin_intraday
+                WHERE ts >= ? AND ts < ? AND price_brl IS NOT NULL ORDER BY ts
+            """, (start_ts, end_ts)).fetchall()
 
-        result = cursor.fetchone()
-        conn.close()
+        columns = [np.array(column) for column in zip(*rows)] if rows else [[]] * len(BAR_FIELDS)
+        if step or not rows:
+            columns = aggregate_bars(*columns, step or resolution or base_resolution)
+        return dict(zip(BAR_FIELDS, columns)), step or resolution or None
 
-        return result[0] if result else None
+    def get_bitcoin_price(self, date=None):
+        """Obtém preço do Bitcoin do banco local"""
+        if self.cache is not None:
+            return self.cache.get_price(BITCOIN_SYMBOL, to_date_str(date) if date else None)
+        return self._latest_price('bitcoin_prices', 'price_brl', BITCOIN_SYMBOL, date)
 
     def get_stock_price(self, symbol, date=None):
         """Obtém preço de ação do banco local"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        if self.cache is not None:
+            return self.cache.get_price(symbol, to_date_str(date) if date else None)
+        return self._latest_price('stock_prices', 'price', symbol, date)
+
+    def _latest_price(self, table, column, symbol, date=None):
+        """Último preço de `symbol` em `table` até `date` (ou o mais recente)"""
+        symbol_id = self.symbol_ids([symbol]).get(symbol)
+        if symbol_id is None:
+            return None
 
         if date:
-            date_str = date.strftime('%Y-%m-%d') if isinstance(date, datetime) else date
-            cursor.execute('SELECT price FROM stock_prices WHERE symbol = ? AND date = ?', 
-                          (symbol, date_str))
+            # Último pregão até a data (fins de semana e feriados)
+            day = to_day(date)
+            cursor = self.db.execute(f"""
+                SELECT {column} FROM {table} WHERE symbol_id = ? AND day <= ? AND day >= ?
+                ORDER BY day DESC LIMIT 1
+            """, (symbol_id, day, day - MAX_STALENESS_DAYS))
         else:
-            cursor.execute('SELECT price FROM stock_prices WHERE symbol = ? ORDER BY date DESC LIMIT 1', 
-                          (symbol,))
+            cursor = self.db.execute(f'SELECT {column} FROM {table} WHERE symbol_id = ? ORDER BY day DESC LIMIT 1',
+                                     (symbol_id,))
 
         result = cursor.fetchone()
-        conn.close()
 
         return result[0] if result else None
 
-    def update_all_data(self, days=7):
-        """Atualiza todos os dados"""
+    def get_price_pairs(self, symbols, start_date, end_date=None, include_bitcoin=True):
+        """Obtém preços inicial e final de vários ativos em uma única consulta
+
+        Retorna {símbolo: (preço_inicial, preço_final)}. O preço inicial é o
+        fechamento em `start_date` (ou no pregão anterior mais próximo); o
+        final é o último fechamento até `end_date` (ou o mais recente). O
+        Bitcoin usa a chave BITCOIN_SYMBOL.
+        """
+        start_str = to_date_str(start_date)
+        end_str = to_date_str(end_date) if end_date else '9999-12-31'
+        symbols = list(dict.fromkeys(list(symbols) + ([BITCOIN_SYMBOL] if include_bitcoin else [])))
+        if not symbols:
+            return {}
+
+        prices = {}
+        if self.cache is not None:
+            for symbol in symbols:
+                end_price = self.cache.get_latest_price(symbol, end_str)
+                if end_price is not None:
+                    prices[symbol] = (self.cache.get_price(symbol, start_str), end_price)
+            return prices
+
+        ids = self.symbol_ids(symbols)
+        if not ids:
+            return prices
+        names = {symbol_id: symbol for symbol, symbol_id in ids.items()}
+        start_day = to_day(start_str)
+        rows = self.db.execute(f"""
+            SELECT l.symbol_id,
+                   (SELECT s.price FROM all_prices s
+                    WHERE s.symbol_id = l.symbol_id AND s.day <= ? AND s.day >= ?
+                    ORDER BY s.day DESC LIMIT 1),
+                   l.price
+            FROM (
+                SELECT symbol_id, price, MAX(day) AS max_day FROM all_prices
+                WHERE symbol_id IN ({placeholders(names)}) AND day <= ?
+                GROUP BY symbol_id
+            ) l
+        """, [start_day, start_day - MAX_STALENESS_DAYS] + list(names) + [to_day(end_str)])
+        for symbol_id, start_price, end_price in rows:
+            prices[names[symbol_id]] = (start_price, end_price)
+        return prices
+
+    def get_price_history(self, symbols, start_date=None, end_date=None):
+        """Retorna {símbolo: (datas datetime64[D], preços)} entre as datas (inclusive)
+
+        Usa o cache em memória quando disponível; senão, uma única consulta.
+        Símbolos sem dados no período ficam de fora.
+        """
+        start_str = to_date_str(start_date) if start_date else '0000-01-01'
+        end_str = to_date_str(end_date) if end_date else '9999-12-31'
+
+        history = {}
+        if self.cache is not None:
+            start, end = np.datetime64(start_str, 'D'), np.datetime64(end_str, 'D')
+            for symbol in symbols:
+                series = self.cache.get_series(symbol)
+                if series is None:
+                    continue
+                dates, prices = series
+                lo, hi = np.searchsorted(dates, [start, end + 1])
+                if hi > lo:
+                    history[symbol] = (dates[lo:hi], prices[lo:hi])
+            return history
+
+        ids = self.symbol_ids(symbols)
+        if not ids:
+            return history
+        names = {symbol_id: symbol for symbol, symbol_id in ids.items()}
+
+        grouped = {}
+        rows = self.db.execute(f"""
+            SELECT symbol_id, day, price FROM all_prices
+            WHERE symbol_id IN ({placeholders(names)}) AND day BETWEEN ? AND ?
+            ORDER BY 1, 2
+        """, list(names) + [to_day(start_str), to_day(end_str)])
+        for symbol_id, day, price in rows:
+            if price is not None:
+                grouped.setdefault(symbol_id, ([], []))
+                grouped[symbol_id][0].append(day)
+                grouped[symbol_id][1].append(price)
+        for symbol_id, (days, prices) in grouped.items():
+            history[names[symbol_id]] = (days_to_datetime64(days), np.array(prices, dtype=float))
+        return history
+
+    def get_watermarks(self, symbols):
+        """Retorna {símbolo: (primeira data, última data, última é definitiva)}
+
+        A última linha é considerada definitiva quando foi gravada depois do
+        fim do dia a que se refere (e não pode mais mudar).
+        """
+        ids = self.symbol_ids(symbols)
+        if not ids:
+            return {}
+        names = {symbol_id: symbol for symbol, symbol_id in ids.items()}
+
+        rows = self.db.execute(f"""
+            SELECT symbol_id, (SELECT MIN(day) FROM all_prices f WHERE f.symbol_id = l.symbol_id),
+                   MAX(day), updated_at
+            FROM all_prices l
+            WHERE symbol_id IN ({placeholders(names)}) GROUP BY symbol_id
+        """, list(names))
+
+        watermarks = {}
+        for symbol_id, first_day, last_day, updated_at in rows:
+            if last_day is not None:
+                final = bool(updated_at) and updated_at // 86400 > last_day
+                watermarks[names[symbol_id]] = (from_day(first_day), from_day(last_day), final)
+        return watermarks
+
+    def get_stored_dates(self, symbols, start_date):
+        """Retorna {símbolo: [datas gravadas a partir de start_date]}"""
+        ids = self.symbol_ids(symbols)
+        if not ids:
+            return {}
+        names = {symbol_id: symbol for symbol, symbol_id in ids.items()}
+
+        stored = {}
+        rows = self.db.execute(f"""
+            SELECT symbol_id, day FROM all_prices WHERE symbol_id IN ({placeholders(names)}) AND day >= ?
+        """, list(names) + [to_day(start_date)])
+        for symbol_id, day in rows:
+            stored.setdefault(names[symbol_id], []).append(from_day(day))
+        return stored
+
+    def iter_price_batches(self, symbols=None, start_date=None, end_date=None, batch_size=EXPORT_BATCH_SIZE):
+        """Itera o histórico de preços (BRL) em lotes de até `batch_size` linhas
+
+        Cada lote é (datas datetime64[D], símbolos, preços), ordenado por
+        símbolo e data. A leitura usa uma conexão própria em uma transação
+        de leitura (visão consistente durante toda a exportação) e busca
+        `batch_size` linhas por vez do cursor, um símbolo de cada vez: a
+        memória não cresce com o período. Sem `symbols`, exporta todos.
+        """
+        start_day = to_day(start_date or '0000-01-01')
+        end_day = to_day(end_date or '9999-12-31')
+
+        with self.db.snapshot() as conn:
+            known = dict(conn.execute('SELECT symbol, id FROM symbols ORDER BY symbol'))
+            symbols = list(known) if symbols is None else [s for s in dict.fromkeys(symbols) if s in known]
+
+            days, names, prices = [], [], []
+            for symbol in symbols:
+                cursor = conn.execute("""
+                    SELECT day, price FROM all_prices
+                    WHERE symbol_id = ? AND day BETWEEN ? AND ? AND price IS NOT NULL
+                    ORDER BY day
+                """, (known[symbol], start_day, end_day))
+                while True:
+                    rows = cursor.fetchmany(batch_size - len(days))
+                    if not rows:
+                        break
+                    for day, price in rows:
+                        days.append(day)
+                        prices.append(price)
+                    names.extend([symbol] * len(rows))
+                    if len(days) >= batch_size:
+                        yield days_to_datetime64(days), names, np.array(prices, dtype=float)
+                        days, names, prices = [], [], []
+            if days:
+                yield days_to_datetime64(days), names, np.array(prices, dtype=float)
+
+    def plan_updates(self, symbols, days=7, today=None):
+        """Calcula os intervalos que realmente precisam ser baixados
+
+        Para cada símbolo retorna os intervalos (início, fim) ainda
+        ausentes: o trecho após a última data gravada (repetindo-a se ainda
+        não for definitiva), o trecho da janela de `days` dias anterior à
+        primeira data gravada e os buracos dentro da janela.
+        Símbolos já atualizados ficam de fora. Fora das criptomoedas só
+        contam buracos (e trechos anteriores) de 3+ pregões, para não buscar feriados da B3 a cada
+        execução.
+        """
+        today = today or datetime.now().date()
+        window_start = today - timedelta(days=days)
+        symbols = list(dict.fromkeys(symbols))
+
+        watermarks = self.get_watermarks(symbols)
+        stored = self.get_stored_dates(symbols, window_start)
+
+        registry = self.get_asset_map()
+        plan = {}
+        for symbol in symbols:
+            asset = registry.get(symbol, ASSET_DEFAULTS)
+            daily = asset['asset_type'] == 'crypto'  # Criptomoedas negociam todos os dias
+            if symbol not in watermarks:
+                plan[symbol] = [(window_start, today)]
+                continue
+
+            first_date, last_date, final = watermarks[symbol]
+            first = date_cls.fromisoformat(first_date)
+            last = date_cls.fromisoformat(last_date)
+
+            ranges = []
+            start = last + timedelta(days=1) if final else last
+            if start <= today and expected_dates(start, today, daily).size:
+                ranges.append((start, today))
+
+            # Janela que começa antes da primeira data gravada: backfill do trecho anterior
+            min_length = 1 if daily else 3
+            if window_start < first and expected_dates(window_start, first - timedelta(days=1), daily).size >= min_length:
+                ranges.append((window_start, first - timedelta(days=1)))
+
+            gap_start = max(window_start, first)
+            if gap_start < last:
+                ranges += missing_runs(
+                    expected_dates(gap_start, last - timedelta(days=1), daily),
+                    np.array(stored.get(symbol, []), dtype='datetime64[D]'),
+                    min_length=min_length
+                )
+
+            if ranges:
+                plan[symbol] = sorted(ranges)
+        return plan
+
+    def update_all_data(self, days=7, symbols=None, incremental=True, progress=None):
+        """Atualiza todos os dados
+
+        Os símbolos vêm do registro de ativos (ativos com fonte Yahoo), a
+        menos que `symbols` seja informado. Com `incremental`, baixa apenas
+        os intervalos ausentes calculados por `plan_updates`; caso
+        contrário, a janela inteira de `days` dias. As fontes (Bitcoin,
+        USD/BRL e lotes de ativos) são consultadas em paralelo, com um prazo
+        comum; uma falha não interrompe as demais. A gravação (inclusive da
+        série USD/BRL) é feita depois, pela thread que chamou, na tabela
+        indicada no registro.
+
+        `progress`, se informado, é chamado com o nome de cada etapa.
+        Retorna a quantidade de linhas gravadas por tabela.
+        """
+        progress = progress or (lambda stage: None)
         logger.info("Iniciando atualização de dados...")
+        progress('planejando')
+        if symbols is None:
+            symbols = [a['symbol'] for a in self.get_assets() if a['source'] == 'yahoo']
+        registry = self.get_asset_map()
+        assets = {symbol: registry.get(symbol) or dict(ASSET_DEFAULTS, symbol=symbol) for symbol in symbols}
+        started = time.monotonic()
+        saved = {'bitcoin_rows': 0, 'stock_rows': 0, 'index_rows': 0}
 
-        # Atualizar Bitcoin
-        btc_data = self.get_bitcoin_data_yahoo(days)
-        if btc_data:
-            self.save_bitcoin_data(btc_data)
+        if incremental:
+            plan = self.plan_updates(symbols, days)
         else:
-            # Tentar scraping como backup
-            scraped_btc = self.scrape_bitcoin_coinmarketcap()
-            if scraped_btc:
-                self.save_bitcoin_data([scraped_btc])
+            today = datetime.now().date()
+            plan = {symbol: [(today - timedelta(days=days), today)] for symbol in symbols}
+
+        if not plan:
+            logger.info("Todos os dados já estão atualizados")
+            return saved
+
+        # Ativos com o mesmo intervalo são baixados juntos
+        asset_ranges = {}
+        for symbol, ranges in plan.items():
+            if assets[symbol]['storage'] != 'bitcoin_prices':
+                for date_range in ranges:
+                    asset_ranges.setdefault(date_range, []).append(symbol)
+
+        # A série USD/BRL é necessária para converter ativos cotados em dólar
+        usd_starts = [start for symbol, ranges in plan.items() if assets[symbol]['currency'] == 'USD'
+                      for start, _ in ranges]
+
+        progress('coletando')
+        fx_ranges = self.fx_ranges(min(usd_starts)) if usd_starts else None
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='collector')
+        try:
+            # As threads só baixam; o banco é lido antes e gravado depois, nesta thread
+            fx_future = pool.submit(self.fetch_fx_rates, fx_ranges) if fx_ranges else None
+            btc_futures = [pool.submit(self.fetch_bitcoin_history, start_date=start, end_date=end)
+                           for start, end in plan.get(BITCOIN_SYMBOL, [])]
+            asset_futures = [
+                pool.submit(self.get_stock_data, group[i:i + self.batch_size],
+                            start_date=start, end_date=end)
+                for (start, end), group in asset_ranges.items()
+                for i in range(0, len(group), self.batch_size)
+            ]
+
+            # Um único prazo para todas as fontes, que rodam em paralelo
+            wait([f for f in [fx_future, *btc_futures, *asset_futures] if f is not None],
+                 timeout=self.source_timeout)
+
+            # Mesmo que a atualização falhe, a série já gravada é usada
+            fx_data = self._source_result(fx_future, 'USD/BRL', 'usd_brl') if fx_future else None
+            btc_frames = [self._source_result(future, 'Bitcoin (Yahoo Finance)', 'bitcoin') for future in btc_futures]
+            btc_frames = [frame for frame in btc_frames if frame is not None and len(frame)]
+            asset_frames = [self._source_result(future, 'ativos', 'assets') for future in asset_futures]
+            asset_frames = [frame for frame in asset_frames if frame is not None and len(frame)]
+
+            scraped_btc = None
+            if btc_futures and not btc_frames and self.source.live:
+                # Tentar scraping como backup
+                scrape_future = pool.submit(self.scrape_bitcoin_coinmarketcap, self.get_usd_brl_rate())
+                wait([scrape_future], timeout=self.source_timeout)
+                scraped_btc = self._source_result(scrape_future, 'CoinMarketCap', 'coinmarketcap')
+        finally:
+            # Não espera por fontes que estouraram o tempo limite
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        # Escritor único
+        progress('gravando')
+        self.save_fx_rates(fx_data)
+        btc_data = None
+        if btc_frames:
+            btc_data = pd.concat(btc_frames, ignore_index=True)
+            self._convert_bitcoin_to_brl(btc_data)
+        elif scraped_btc:
+            btc_data = [scraped_btc]
+        if btc_data is not None:
+            self.save_bitcoin_data(btc_data)
+            saved['bitcoin_rows'] = len(btc_data)
+        if asset_frames:
+            asset_data = pd.concat(asset_frames, ignore_index=True)
+            usd = asset_data['symbol'].map(lambda symbol: assets[symbol]['currency'] == 'USD')
+            if usd.any():
+                asset_data.loc[usd, 'price'] = self.get_fx_rates().convert(
+                    asset_data.loc[usd, 'date'], asset_data.loc[usd, 'price'])
+
+            storage = asset_data['symbol'].map(lambda symbol: assets[symbol]['storage'])
+            stock_data = asset_data[storage == 'stock_prices']
+            index_data = asset_data[storage == 'index_prices']
+            if len(stock_data):
+                self.save_stock_data(stock_data)
+                saved['stock_rows'] = len(stock_data)
+            if len(index_data):
+                self.save_index_data(index_data)
+                saved['index_rows'] = len(index_data)
+
+        if saved['bitcoin_rows'] or saved['stock_rows'] or saved['index_rows']:
+            progress('materializando')
+            saved['stats_rows'] = self.materialize_stats()
+
+        logger.info(f"Atualização concluída em {time.monotonic() - started:.1f}s")
+        return saved
+
+    def materialize_stats(self):
+        """Atualiza a tabela price_stats apenas a partir das datas alteradas
+
+        Para cada símbolo, recalcula a partir da menor data cujo preço foi
+        gravado depois da última materialização (novos dias, buracos
+        preenchidos ou o último dia buscado de novo), usando as linhas
+        anteriores já materializadas como contexto. Retorna o número de
+        linhas gravadas.
+
+        A última materialização é a marca 'stats_watermark' em data_meta:
+        o maior updated_at de preço já processado. Ela é lida e avançada na
+        mesma transação de escrita que encontra as pendências; gravações
+        posteriores recebem updated_at maior que ela (ver _price_stamp). Se
+        o cálculo falhar, a marca anterior é restaurada.
+        """
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT value FROM data_meta WHERE key = 'stats_watermark'").fetchone()
+            watermark = row[0] if row else None
+            pending = conn.execute("""
+                SELECT symbol_id, MIN(day) FROM all_prices
+                WHERE price IS NOT NULL AND (? IS NULL OR updated_at > ?)
+                GROUP BY symbol_id
+            """, (watermark, watermark)).fetchall()
+            latest = conn.execute('SELECT MAX(updated_at) FROM all_prices').fetchone()[0]
+            if latest is not None and latest != watermark:
+                conn.execute("""
+                    INSERT INTO data_meta (key, value) VALUES ('stats_watermark', ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """, (latest,))
+
+        try:
+            total = self._materialize_pending(pending)
+        except BaseException:
+            with self.db.transaction() as conn:
+                if watermark is None:
+                    conn.execute("DELETE FROM data_meta WHERE key = 'stats_watermark' AND value = ?", (latest,))
+                else:
+                    conn.execute("UPDATE data_meta SET value = ? WHERE key = 'stats_watermark' AND value = ?",
+                                 (watermark, latest))
+            raise
 
-        # Atualizar ações brasileiras
-        symbols = ['PETR4.SA', 'ITUB4.SA', 'VALE3.SA', 'BOVA11.SA', 'BBAS3.SA']
-        stock_data = self.get_stock_data(symbols, days)
-        if stock_data:
-            self.save_stock_data(stock_data)
+        logger.info(f"Materializadas {total} linhas de estatísticas")
+        return total
 
-        logger.info("Atualização concluída")
+    def _materialize_pending(self, pending):
+        """Recalcula price_stats de cada (symbol_id, primeiro dia alterado)"""
+        names = self.symbol_names() if pending else {}
+
+        total = 0
+        for symbol_id, first_day in pending:
+            if first_day is None:
+                continue
+            symbol = names[symbol_id]
+
+            # Contexto: últimas linhas materializadas antes do trecho
+            context = self.db.execute("""
+                SELECT day, log_return, cum_index, rolling_max FROM price_stats
+                WHERE symbol_id = ? AND day < ? ORDER BY day DESC LIMIT ?
+            """, (symbol_id, first_day, VOLATILITY_WINDOW - 1)).fetchall()[::-1]
+
+            history = self.get_price_history([symbol], from_day(context[-1][0] if context else first_day))
+            if symbol not in history:
+                continue
+            dates, prices = history[symbol]
+            if context:
+                prev_price = prices[0]
+                dates, prices = dates[1:], prices[1:]
+                kwargs = {
+                    'first_price': prev_price / context[-1][2],
+                    'prev_price': prev_price,
+                    'prev_returns': [np.nan if r is None else r for _, r, _, _ in context],
+                    'prev_max': context[-1][3]
+                }
+            else:
+                kwargs = {'first_price': prices[0]}
+            if not len(prices):
+                continue
+
+            log_returns, cum_index, volatility, rolling_max = compute_stats(prices, **kwargs)
+            rows = [
+                (symbol_id, day, *(None if np.isnan(v) else float(v) for v in values))
+                for day, *values in zip(dates.astype(np.int64).tolist(), log_returns, cum_index, volatility, rolling_max)
+            ]
+            with SAVE_BATCH_SECONDS.time(table='price_stats'), self.db.transaction() as conn:
+                conn.executemany(f"""
+                    INSERT INTO price_stats (symbol_id, day, log_return, cum_index, volatility, rolling_max)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(symbol_id, day) DO UPDATE SET
+                        log_return = excluded.log_return,
+                        cum_index = excluded.cum_index,
+                        volatility = excluded.volatility,
+                        rolling_max = excluded.rolling_max,
+                        updated_at = {NOW_SQL}
+                """, rows)
+                ROWS_SAVED.inc(len(rows), table='price_stats')
+            total += len(rows)
+        return total
+
+    def get_return(self, symbol, start_date, end_date=None):
+        """Retorno (%) entre duas datas pela razão dos índices acumulados
+
+        As datas são resolvidas para o pregão anterior mais próximo; o fim é
+        o último pregão disponível se `end_date` for None.
+        """
+        symbol_id = self.symbol_ids([symbol]).get(symbol)
+        if symbol_id is None:
+            return None
+        start_day = to_day(start_date)
+        end_day = to_day(end_date if end_date else '9999-12-31')
+        start_index, end_index = self.db.execute("""
+            SELECT
+                (SELECT cum_index FROM price_stats WHERE symbol_id = ? AND day <= ? AND day >= ?
+                 ORDER BY day DESC LIMIT 1),
+                (SELECT cum_index FROM price_stats WHERE symbol_id = ? AND day <= ?
+                 ORDER BY day DESC LIMIT 1)
+        """, (symbol_id, start_day, start_day - MAX_STALENESS_DAYS, symbol_id, end_day)).fetchone()
+        if not start_index or end_index is None:
+            return None
+        return (end_index / start_index - 1) * 100
+
+    def queue_run(self, days=7, kind='manual', trigger='manual'):
+        """Registra uma coleta que vai rodar depois (status 'queued'); retorna o id
+
+        O id é passado a run_collection(run_id=...) quando ela rodar, e o
+        andamento pode ser acompanhado por qualquer processo com get_run.
+        """
+        return self._insert_run(kind, trigger, days, None, 'queued', None)
+
+    def run_collection(self, days=7, kind='manual', trigger='manual', scheduled_for=None, progress=None,
+                       run_id=None):
+        """Executa update_all_data sob o lock de coleta e registra a execução
+
+        Só uma coleta roda por vez entre todos os processos que usam o banco
+        (scheduler, servidor web, linha de comando): se outra estiver em
+        andamento, nada é baixado e a execução fica registrada como
+        'skipped'. Com `run_id` (de queue_run), atualiza esse registro em
+        vez de criar outro. Retorna o registro da execução (ver get_runs).
+        """
+        lock = LeaseLock(self.db, COLLECTION_LOCK)
+        if not lock.acquire():
+            holder = lock.holder()
+            error = f"Coleta em andamento: {holder['owner'] if holder else 'outro processo'}"
+            if run_id is None:
+                run_id = self._insert_run(kind, trigger, days, scheduled_for, 'skipped', lock.owner, error)
+            else:
+                self._start_run(run_id, 'skipped', lock.owner, error)
+            logger.info(f"Coleta {kind} ignorada: outra coleta em andamento")
+            return self.get_run(run_id)
+
+        started = time.monotonic()
+        saved, status, error = {}, 'done', None
+        try:
+            # Com o lock, nenhuma outra coleta pode estar rodando: execuções
+            # 'running' que restaram foram interrompidas (processo encerrado),
+            # assim como as enfileiradas há mais que o prazo do lock
+            with self.db.transaction() as conn:
+                conn.execute(f"""
+                    UPDATE collection_runs SET status = 'failed', error = 'Interrompida'
+                    WHERE status = 'running'
+                       OR (status = 'queued' AND started_at < {NOW_SQL} - ? AND id IS NOT ?)
+                """, (LOCK_TTL_SECONDS, run_id))
+            if run_id is None:
+                run_id = self._insert_run(kind, trigger, days, scheduled_for, 'running', lock.owner)
+            else:
+                self._start_run(run_id, 'running', lock.owner)
+            try:
+                saved = self.update_all_data(days=days, progress=progress)
+            except Exception as e:
+                logger.error(f"Erro na coleta {kind}: {e}")
+                status, error = 'failed', str(e)
+
+            with self.db.transaction() as conn:
+                conn.execute(f"""
+                    UPDATE collection_runs SET
+                        status = ?, finished_at = {NOW_SQL}, duration_seconds = ?,
+                        bitcoin_rows = ?, stock_rows = ?, index_rows = ?, stats_rows = ?, error = ?
+                    WHERE id = ?
+                """, (status, round(time.monotonic() - started, 3),
+                      *(saved.get(f'{name}_rows') for name in ('bitcoin', 'stock', 'index', 'stats')),
+                      error, run_id))
+        finally:
+            lock.release()
+        return self.get_run(run_id)
+
+    def _insert_run(self, kind, trigger, days, scheduled_for, status, owner, error=None):
+        with self.db.transaction() as conn:
+            cursor = conn.execute(f"""
+                INSERT INTO collection_runs (kind, trigger, days, scheduled_for, status, owner, started_at, error)
+                VALUES (?, ?, ?, ?, ?, ?, {NOW_SQL}, ?)
+            """, (kind, trigger, days, scheduled_for, status, owner, error))
+            return cursor.lastrowid
+
+    def skip_run(self, run_id, error):
+        """Marca uma execução enfileirada como ignorada (ex.: pedido agrupado a outro)"""
+        self._start_run(run_id, 'skipped', None, error)
+
+    def _start_run(self, run_id, status, owner, error=None):
+        """Passa uma execução enfileirada (queue_run) para running ou skipped"""
+        with self.db.transaction() as conn:
+            conn.execute(f"""
+                UPDATE collection_runs SET status = ?, owner = ?, started_at = {NOW_SQL}, error = ?
+                WHERE id = ?
+            """, (status, owner, error, run_id))
+
+    def get_runs(self, limit=20, trigger=None, status=None):
+        """Histórico de coletas (dicts), da mais recente para a mais antiga"""
+        filters = [(column, value) for column, value in (('trigger', trigger), ('status', status)) if value]
+        where = ('WHERE ' + ' AND '.join(f'{column} = ?' for column, _ in filters)) if filters else ''
+        rows = self.db.execute(f"""
+            SELECT {', '.join(RUN_COLUMNS)} FROM collection_runs {where} ORDER BY id DESC LIMIT ?
+        """, [value for _, value in filters] + [limit])
+        return [dict(zip(RUN_COLUMNS, row)) for row in rows]
+
+    def get_run(self, run_id):
+        """Registro de uma execução ou None"""
+        row = self.db.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM collection_runs WHERE id = ?",
+                              (run_id,)).fetchone()
+        return dict(zip(RUN_COLUMNS, row)) if row else None
+
+    def _source_result(self, future, name, source):
+        """Obtém o resultado de uma fonte já aguardada, isolando erros e tempo limite"""
+        if not future.done():
+            logger.error(f"Tempo limite excedido ao coletar {name}")
+        else:
+            try:
+                return future.result()
+            except Exception as e:
+                logger.error(f"Erro ao coletar {name}: {e}")
+        SOURCE_ERRORS.inc(source=source)
+        return None
 
     def get_data_summary(self):
         """Retorna resumo dos dados armazenados"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.db.connection()
 
         # Bitcoin
         btc_count = conn.execute('SELECT COUNT(*) FROM bitcoin_prices').fetchone()[0]
-        btc_latest = conn.execute('SELECT date, price_brl FROM bitcoin_prices ORDER BY date DESC LIMIT 1').fetchone()
+        btc_latest = conn.execute('SELECT day, price_brl FROM bitcoin_prices ORDER BY day DESC LIMIT 1').fetchone()
+        if btc_latest:
+            btc_latest = (from_day(btc_latest[0]), btc_latest[1])
 
         # Ações
         stock_count = conn.execute('SELECT COUNT(*) FROM stock_prices').fetchone()[0]
-        symbols_count = conn.execute('SELECT COUNT(DISTINCT symbol) FROM stock_prices').fetchone()[0]
-
-        conn.close()
+        symbols_count = conn.execute('SELECT COUNT(DISTINCT symbol_id) FROM stock_prices').fetchone()[0]
 
         return {
             'bitcoin_records': btc_count,
@@ -287,11 +1658,20 @@ class DataCollector:
         }
 
 if __name__ == "__main__":
+    import sys
+    from assets import load_assets_file
+
     collector = DataCollector()
 
+    # Opcional: cadastrar ativos de um arquivo JSON/CSV antes da coleta
+    if len(sys.argv) > 1:
+        collector.save_assets(load_assets_file(sys.argv[1]))
+
     # Primeira execução - coletar dados dos últimos 30 dias
     print("🚀 Iniciando coleta de dados...")
-    collector.update_all_data(days=30)
+    run = collector.run_collection(days=30, trigger='cli')
+    if run['status'] == 'skipped':
+        print(f"⏳ {run['error']}")
 
     # Mostrar resumo
     summary = collector.get_data_summary()
@@ -0,0 +1,126 @@
+import os
+import numpy as np
+from lazy_imports import LazyModule
+
+# Carregados no primeiro uso (o servidor web não coleta dados)
+pd = LazyModule('pandas')
+yf = LazyModule('yfinance')
+
+# Colunas dos arquivos de replay (formato longo: uma linha por símbolo e data)
+REPLAY_COLUMNS = ['date', 'symbol', 'close', 'volume']
+
+
+def naive_utc(moment):
+    """Timestamp sem fuso (UTC), como as datas dos arquivos de replay"""
+    moment = pd.Timestamp(moment)
+    return moment.tz_convert('UTC').tz_localize(None) if moment.tzinfo else moment
+
+
+class YahooSource:
+    """Fonte de dados padrão: Yahoo Finance via yfinance
+
+    `download` devolve o mesmo formato de yf.download (colunas
+    (símbolo, campo)) e `history` o de yf.Ticker(...).history; `end` é
+    exclusivo em ambos. `interval` segue o yfinance ('1d', '5m', '1m'...).
+    """
+
+    # Fonte online: o coletor pode recorrer ao scraping se ela falhar
+    live = True
+
+    def __init__(self, download_func=None):
+        self.download_func = download_func
+
+    def download(self, symbols, start, end):
+        download_func = self.download_func or yf.download
+        return download_func(
+            list(symbols), start=start, end=end, group_by='ticker',
+            auto_adjust=True, progress=False
+        )
+
+    def history(self, symbol, start, end, interval='1d'):
+        return yf.Ticker(symbol).history(start=start, end=end, interval=interval)
+
+
+class ReplaySource:
+    """Fonte local que reproduz históricos gravados (sem acesso à rede)
+
+    Os dados ficam em um DataFrame no formato longo (date, symbol, close,
+    volume), lido de arquivos CSV/Parquet com `from_path` ou gerado por
+    `synthetic_history`. As consultas devolvem o mesmo formato do
+    YahooSource, então o coletor não distingue as duas fontes.
+    """
+
+    live = False
+
+    def __init__(self, frame):
+        frame = frame.reindex(columns=REPLAY_COLUMNS)
+        frame['date'] = pd.to_datetime(frame['date'])
+        frame['volume'] = frame['volume'].fillna(0)
+        self._series = {
+            symbol: group.set_index('date').sort_index()[['close', 'volume']]
+                         .rename(columns={'close': 'Close', 'volume': 'Volume'})
+            for symbol, group in frame.groupby('symbol')
+        }
+
+    @classmethod
+    def from_path(cls, path):
+        """Carrega um arquivo CSV/Parquet ou todos os arquivos de um diretório"""
+        paths = [path]
+        if os.path.isdir(path):
+            paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if name.endswith(('.csv', '.parquet')))
+        frames = [pd.read_parquet(p) if p.endswith('.parquet') else pd.read_csv(p) for p in paths]
+        return cls(pd.concat(frames, ignore_index=True))
+
+    def symbols(self):
+        return list(self._series)
+
+    def history(self, symbol, start, end, interval='1d'):
+        # Reproduz as barras gravadas, qualquer que seja o intervalo pedido
+        series = self._series.get(symbol)
+        if series is None:
+            return pd.DataFrame(columns=['Close', 'Volume'], index=pd.DatetimeIndex([]))
+        return series[(series.index >= naive_utc(start)) & (series.index < naive_utc(end))]
+
+    def download(self, symbols, start, end):
+        frames = {symbol: self.history(symbol, start, end) for symbol in symbols if symbol in self._series}
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1)
+
+
+def synthetic_history(symbols, start_date, end_date, daily_symbols=(), seed=0):
+    """Gera históricos determinísticos (passeio aleatório geométrico)
+
+    Símbolos de `daily_symbols` têm fechamento todos os dias; os demais,
+    apenas em dias úteis. Retorna um DataFrame no formato de replay.
+    """
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(str(start_date)[:10], 'D'), np.datetime64(str(end_date)[:10], 'D') + 1)
+    business = days[np.is_busday(days)]
+
+    frames = []
+    for symbol in symbols:
+        dates = days if symbol in daily_symbols else business
+        start_price = rng.uniform(5, 500)
+        returns = rng.normal(0.0003, 0.02, len(dates))
+        frames.append(pd.DataFrame({
+            'date': dates,
+            'symbol': symbol,
+            'close': start_price * np.exp(np.cumsum(returns)),
+            'volume': rng.integers(1_000, 1_000_000, len(dates)),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def synthetic_intraday(symbol, start, end, interval_seconds=300, seed=0):
+    """Gera barras intradiárias determinísticas de `symbol` entre start e end"""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq=f'{interval_seconds}s', inclusive='left')
+    returns = rng.normal(0, 0.001, len(timestamps))
+    return pd.DataFrame({
+        'date': timestamps,
+        'symbol': symbol,
+        'close': rng.uniform(50_000, 100_000) * np.exp(np.cumsum(returns)),
+        'volume': rng.integers(1, 1_000, len(timestamps)),
+    })
@@ -0,0 +1,139 @@
+import sqlite3
+import threading
+import os
+import weakref
+from contextlib import contextmanager
+import logging
+from metrics import DB_QUERY_SECONDS, DB_TRANSACTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Pragmas aplicados a cada nova conexão
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',         # Leitores não bloqueiam o escritor (e vice-versa)
+    'synchronous': 'NORMAL',       # Seguro com WAL e bem mais rápido que FULL
+    'cache_size': -16000,          # ~16 MB de cache de páginas por conexão
+    'mmap_size': 268435456,        # 256 MB de leitura via mmap
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,          # Espera até 5s por locks de outros processos
+}
+
+
+class _ThreadConnection:
+    """Conexão de uma thread, fechada quando a thread termina
+
+    Só o armazenamento local da thread guarda referência forte a este
+    objeto: quando a thread acaba, ele é coletado e o finalizador fecha a
+    conexão.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pid = os.getpid()
+        self.close = weakref.finalize(self, conn.close)
+
+
+class ConnectionManager:
+    """Mantém conexões SQLite persistentes por thread
+
+    Cada thread (workers do Flask, scheduler) reutiliza a sua própria conexão
+    em vez de abrir/fechar uma a cada consulta; ela é fechada quando a thread
+    termina (o servidor de desenvolvimento do Flask usa uma thread por
+    requisição). As escritas passam por
+    `transaction()`, que serializa os escritores do processo e usa
+    BEGIN IMMEDIATE para não disputar o lock com outros processos no meio
+    da transação.
+    """
+
+    def __init__(self, db_path, pragmas=None, cached_statements=256):
+        self.db_path = db_path
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.cached_statements = cached_statements
+
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._holders = weakref.WeakSet()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.pragmas.get('busy_timeout', 5000) / 1000,
+            isolation_level=None,  # Transações controladas explicitamente
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    def connection(self):
+        """Retorna a conexão da thread atual, criando-a se necessário"""
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None and holder.pid != os.getpid():
+            # Após um fork (ex.: múltiplos workers) a conexão herdada não pode
+            # ser usada nem fechada (o close mexeria no WAL do processo pai)
+            holder.close.detach()
+            holder = None
+        if holder is None:
+            holder = _ThreadConnection(self._connect())
+            self._local.holder = holder
+            self._holders.add(holder)
+        return holder.conn
+
+    def execute(self, sql, params=()):
+        """Executa uma consulta de leitura na conexão da thread
+
+        O tempo medido cobre a preparação e o primeiro passo da consulta
+        (todo o trabalho, em agregações); a leitura das linhas fica com quem
+        itera o cursor.
+        """
+        operation = sql.lstrip().split(None, 1)[0].lower()
+        with DB_QUERY_SECONDS.time(operation=operation):
+            return self.connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Abre uma transação de escrita (commit ao sair, rollback em erro)"""
+        with self._write_lock:
+            conn = self.connection()
+            if conn.in_transaction:
+                # Transação aninhada: a externa cuida do commit
+                yield conn
+                return
+
+            with DB_TRANSACTION_SECONDS.time():
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+                else:
+                    conn.execute('COMMIT')
+
+    @contextmanager
+    def snapshot(self):
+        """Conexão dedicada com uma transação de leitura aberta
+
+        Para leituras longas (ex.: exportações em streaming): todas as
+        consultas veem o mesmo estado do banco, mesmo com escritas de outros
+        processos no meio do caminho, e a conexão da thread fica livre.
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            yield conn
+        finally:
+            conn.close()
+
+    def close_all(self):
+        """Fecha as conexões das threads ainda vivas deste gerenciador"""
+        for holder in list(self._holders):
+            try:
+                holder.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Erro ao fechar conexão: {e}")
+        self._holders = weakref.WeakSet()
+        self._local = threading.local()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+import logging
+from data_collector import BITCOIN_SYMBOL
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(event):
+    """Formata um evento no protocolo server-sent events"""
+    return f"id: {event['version']}\nevent: price\ndata: {json.dumps(event)}\n\n"
+
+
+class Subscription:
+    """Fila de eventos de um cliente conectado (consumida por uma thread)
+
+    Guarda só os `maxsize` eventos mais recentes: um cliente lento perde
+    eventos intermediários, nunca o último.
+    """
+
+    def __init__(self, maxsize=16):
+        self._queue = queue.Queue(maxsize)
+
+    def push(self, event):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Próximo evento, ou None se nada chegar em `timeout` segundos"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """Fila de eventos consumida por uma corrotina (servidor ASGI)"""
+
+    def __init__(self, maxsize=16):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+
+    def push(self, event):
+        # O publicador roda em outra thread; a fila pertence ao event loop
+        self._loop.call_soon_threadsafe(self._push, event)
+
+    def _push(self, event):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class PricePublisher:
+    """Publica o preço atual do Bitcoin e a versão dos dados para os clientes
+
+    É avisado pelo coletor a cada escrita neste processo e, para escritas de
+    outros processos (scheduler, outros workers), uma única thread verifica
+    a versão a cada `poll_interval` segundos. Cada mudança gera um evento
+    enviado a todas as inscrições, em vez de uma consulta por cliente.
+    """
+
+    def __init__(self, collector, poll_interval=2.0):
+        self.collector = collector
+        self.poll_interval = poll_interval
+        self.latest = None
+        self.published = 0
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._watcher = None
+
+        collector.add_listener(self.notify)
+
+    @property
+    def subscribers(self):
+        return len(self._subscriptions)
+
+    def subscribe(self, subscription=None):
+        """Registra um cliente; ele recebe o último evento imediatamente"""
+        subscription = subscription or Subscription()
+        self._start_watcher()
+        event = self.latest or self._build_event()
+        with self._lock:
+            if self.latest is None:
+                self.latest = event
+            self._subscriptions.add(subscription)
+            event = self.latest
+        subscription.push(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def notify(self, state=None):
+        """Chamado após uma escrita; publica se a versão mudou"""
+        try:
+            event = self._build_event(state)
+        except Exception as e:
+            logger.error(f"Erro ao montar evento de preço: {e}")
+            return
+
+        with self._lock:
+            if self.latest is not None and event['version'] == self.latest['version']:
+                return
+            self.latest = event
+            self.published += 1
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def _build_event(self, state=None):
+        version, updated_at = state or self.collector.get_data_state()
+        return {
+            'version': version,
+            'updated_at': updated_at,
+            'symbol': BITCOIN_SYMBOL,
+            'price': self.collector.get_bitcoin_price(),
+            'currency': 'BRL'
+        }
+
+    def _start_watcher(self):
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, name='price-publisher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if self._subscriptions:
+                self.notify()
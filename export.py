@@ -0,0 +1,102 @@
+import csv
+import importlib.util
+import io
+import numpy as np
+from lazy_imports import LazyModule
+
+# Opcional: só as exportações Arrow/Parquet precisam do pyarrow
+pa = LazyModule('pyarrow')
+pq = LazyModule('pyarrow.parquet')
+
+# Colunas exportadas, na ordem dos lotes de DataCollector.iter_price_batches
+EXPORT_COLUMNS = ('date', 'symbol', 'price')
+
+# Formato -> (tipo MIME, extensão do arquivo)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def arrow_available():
+    """Indica se o pyarrow está instalado (formatos arrow e parquet)"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+class ChunkSink:
+    """Arquivo só de escrita cujo conteúdo é retirado em pedaços com `drain()`
+
+    Recebe a saída dos writers do pyarrow; o que foi escrito até um lote é
+    enviado ao cliente e descartado, sem acumular o arquivo inteiro.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_csv(batches):
+    """CSV com cabeçalho; um pedaço de texto por lote"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+
+    for dates, symbols, prices in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(zip(dates.astype(str).tolist(), symbols, prices.tolist()))
+        yield buffer.getvalue()
+
+
+def iter_arrow(batches, fmt='arrow'):
+    """Stream IPC do Arrow ou Parquet; um record batch (ou row group) por lote
+
+    No Parquet o rodapé com os metadados só é escrito no final, no último
+    pedaço.
+    """
+    schema = pa.schema([('date', pa.date32()), ('symbol', pa.string()), ('price', pa.float64())])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == 'parquet' else pa.ipc.new_stream(sink, schema)
+    try:
+        for dates, symbols, prices in batches:
+            writer.write_batch(pa.record_batch([
+                pa.array(dates.astype(np.int64).astype(np.int32), pa.int32()).cast(pa.date32()),
+                pa.array(symbols, pa.string()),
+                pa.array(prices, pa.float64()),
+            ], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(batches, fmt='csv'):
+    """Converte os lotes de preços em pedaços (str ou bytes) no formato pedido"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {fmt}")
+    if fmt == 'csv':
+        return iter_csv(batches)
+    return iter_arrow(batches, fmt)
@@ -0,0 +1,34 @@
+import numpy as np
+from price_cache import to_datetime64
+
+
+class FxRates:
+    """Série diária USD/BRL em memória, indexada por data
+
+    Datas sem cotação (fins de semana, feriados) usam a última cotação
+    anterior; datas anteriores ao início da série usam a primeira.
+    """
+
+    def __init__(self, dates=(), rates=()):
+        order = np.argsort(to_datetime64(dates), kind='stable')
+        self.dates = to_datetime64(dates)[order]
+        self.rates = np.asarray(rates, dtype=float)[order]
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _index(self, dates):
+        i = np.searchsorted(self.dates, dates, side='right') - 1
+        return np.clip(i, 0, len(self.dates) - 1)
+
+    def rate_on(self, date=None):
+        """Cotação do dia (ou a anterior mais próxima); a mais recente se date for None"""
+        if not len(self):
+            return None
+        if date is None:
+            return float(self.rates[-1])
+        return float(self.rates[self._index(np.datetime64(str(date)[:10], 'D'))])
+
+    def convert(self, dates, usd_values):
+        """Converte valores em USD para BRL usando a cotação de cada data"""
+        return np.asarray(usd_values, dtype=float) * self.rates[self._index(to_datetime64(dates))]
@@ -0,0 +1,49 @@
+import numpy as np
+
+# Intervalos aceitos na coleta intradiária -> segundos
+INTERVALS = {'1m': 60, '2m': 120, '5m': 300, '15m': 900, '30m': 1800, '60m': 3600}
+
+# Agregações materializadas (segundos): por hora e por dia (UTC)
+ROLLUP_RESOLUTIONS = (3600, 86400)
+
+# Colunas das barras, na ordem usada pelas funções deste módulo
+BAR_FIELDS = ('ts', 'open', 'high', 'low', 'close', 'volume')
+
+
+def aggregate_bars(ts, open_, high, low, close, volume, step):
+    """Agrupa barras ordenadas por `ts` em janelas de `step` segundos
+
+    Cada janela começa em um múltiplo de `step` (epoch UTC) e tem abertura
+    da primeira barra, fechamento da última, máxima/mínima e volume somado.
+    Retorna uma tupla de arrays na ordem de BAR_FIELDS.
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    if not len(ts):
+        return tuple(np.array([], dtype=np.int64 if f == 'ts' else float) for f in BAR_FIELDS)
+
+    buckets = ts // step * step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ts)] - 1
+    return (
+        buckets[starts],
+        np.asarray(open_, dtype=float)[starts],
+        np.maximum.reduceat(np.asarray(high, dtype=float), starts),
+        np.minimum.reduceat(np.asarray(low, dtype=float), starts),
+        np.asarray(close, dtype=float)[ends],
+        np.add.reduceat(np.nan_to_num(np.asarray(volume, dtype=float)), starts),
+    )
+
+
+def choose_resolution(start_ts, end_ts, max_points, base_resolution):
+    """Escolhe a fonte da leitura e o passo do reagrupamento
+
+    Retorna (resolução, passo): resolução 0 são as barras brutas (de
+    `base_resolution` segundos); as demais, uma agregação materializada —
+    a maior que não ultrapasse o passo necessário para caber em
+    `max_points`. O passo é None quando as linhas já cabem sem reagrupar.
+    """
+    step = max(-(-max(end_ts - start_ts, 1) // max_points), base_resolution)
+    resolution = max([r for r in ROLLUP_RESOLUTIONS if r <= step], default=0)
+    unit = resolution or base_resolution
+    step = -(-step // unit) * unit
+    return resolution, (step if step > unit else None)
@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """Tarefa executada em segundo plano pela JobQueue"""
+
+    def __init__(self, kind, func, args=(), kwargs=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.requests = 1  # Quantas solicitações foram atendidas por esta execução
+
+    def set_progress(self, stage):
+        self.progress = stage
+
+    def to_dict(self):
+        duration = None
+        if self.started_at:
+            duration = ((self.finished_at or datetime.now()) - self.started_at).total_seconds()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'requests': self.requests,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'queued_seconds': ((self.started_at or datetime.now()) - self.created_at).total_seconds(),
+            'duration_seconds': duration
+        }
+
+
+class JobQueue:
+    """Fila de tarefas com uma thread trabalhadora
+
+    Solicitações de um mesmo tipo (`kind`) enquanto outra ainda está na fila
+    ou em execução são agrupadas: recebem o mesmo job em vez de gerar uma
+    nova execução.
+    """
+
+    def __init__(self, max_history=100):
+        self.max_history = max_history
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()  # id -> Job (histórico limitado)
+        self._active = {}  # kind -> Job na fila ou em execução
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Enfileira `func` e retorna o job (ou o já pendente do mesmo tipo)"""
+        with self._lock:
+            active = self._active.get(kind)
+            if active is not None:
+                active.requests += 1
+                return active
+
+            job = Job(kind, func, args, kwargs)
+            self._active[kind] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_history:
+                self._jobs.popitem(last=False)
+
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='job-worker', daemon=True)
+                self._worker.start()
+
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.status = 'running'
+            job.started_at = datetime.now()
+            started = time.monotonic()
+            try:
+                job.result = job.func(*job.args, progress=job.set_progress, **job.kwargs)
+                job.status = 'done'
+            except Exception as e:
+                logger.error(f"Erro no job {job.kind} ({job.id}): {e}")
+                job.error = str(e)
+                job.status = 'failed'
+            finally:
+                job.finished_at = datetime.now()
+                with self._lock:
+                    self._active.pop(job.kind, None)
+                logger.info(f"Job {job.kind} ({job.id}) finalizado em {time.monotonic() - started:.1f}s")
+                self._queue.task_done()
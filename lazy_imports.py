@@ -0,0 +1,31 @@
+import importlib
+import sys
+
+
+class LazyModule:
+    """Módulo importado só no primeiro acesso a um de seus atributos
+
+    Usado para as dependências da coleta (pandas, yfinance, requests, bs4):
+    o servidor web, que só lê o banco, não paga o tempo de importá-las.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'carregado' if self._module is not None else 'não carregado'
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def is_loaded(name):
+    """Indica se o módulo já foi importado neste processo"""
+    return name in sys.modules
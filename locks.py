@@ -0,0 +1,87 @@
+import os
+import socket
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prazo padrão dos locks (segundos); renovado a cada terço enquanto detido
+LOCK_TTL_SECONDS = 300
+
+
+class LeaseLock:
+    """Lock entre processos guardado no banco (tabela locks), com prazo
+
+    Quem o obtém tem uma thread que renova o prazo enquanto o detém; se o
+    processo morrer sem liberá-lo, outro pode tomá-lo depois que o prazo
+    vencer. Todos os processos que abrem o mesmo banco (scheduler, workers
+    do servidor web, linha de comando) respeitam o mesmo lock.
+    """
+
+    def __init__(self, db, name, ttl=LOCK_TTL_SECONDS, clock=time.time):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.clock = clock
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+        self._stop = None
+        self._heartbeat = None
+
+    def acquire(self):
+        """Tenta obter o lock sem esperar; retorna True se conseguiu"""
+        now = int(self.clock())
+        with self.db.transaction() as conn:
+            conn.execute("""
+                INSERT INTO locks (name, owner, acquired_at, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    owner = excluded.owner,
+                    acquired_at = excluded.acquired_at,
+                    expires_at = excluded.expires_at
+                WHERE locks.expires_at <= excluded.acquired_at OR locks.owner = excluded.owner
+            """, (self.name, self.owner, now, now + self.ttl))
+            owner = conn.execute('SELECT owner FROM locks WHERE name = ?', (self.name,)).fetchone()[0]
+
+        if owner != self.owner:
+            return False
+        if self._heartbeat is None:
+            self._stop = threading.Event()
+            self._heartbeat = threading.Thread(target=self._renew_loop, name=f'lock-{self.name}', daemon=True)
+            self._heartbeat.start()
+        return True
+
+    def renew(self):
+        """Estende o prazo; retorna False se o lock já não é deste dono"""
+        with self.db.transaction() as conn:
+            cursor = conn.execute("""
+                UPDATE locks SET expires_at = ? WHERE name = ? AND owner = ?
+            """, (int(self.clock()) + self.ttl, self.name, self.owner))
+            return cursor.rowcount == 1
+
+    def release(self):
+        """Libera o lock (se ainda for deste dono) e para a renovação"""
+        if self._heartbeat is not None:
+            self._stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM locks WHERE name = ? AND owner = ?', (self.name, self.owner))
+
+    def holder(self):
+        """Dono atual do lock e prazo (epoch), ou None se está livre"""
+        row = self.db.execute(
+            'SELECT owner, expires_at FROM locks WHERE name = ? AND expires_at > ?',
+            (self.name, int(self.clock()))
+        ).fetchone()
+        return {'owner': row[0], 'expires_at': row[1]} if row else None
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    logger.warning(f"Lock {self.name} perdido (prazo vencido)")
+                    return
+            except Exception as e:
+                logger.error(f"Erro ao renovar lock {self.name}: {e}")
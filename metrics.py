@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Limites (em segundos) dos buckets padrão dos histogramas
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Diretório compartilhado pelos processos de um mesmo servidor (ver MetricsRegistry.share)
+METRICS_DIR = os.environ.get('METRICS_DIR')
+
+# Intervalo (s) em que cada processo grava seus valores no diretório compartilhado
+METRICS_FLUSH_SECONDS = 1
+
+
+def format_labels(names, values, extra=()):
+    """Formata rótulos no padrão Prometheus: {a="1",b="2"}"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    """Base das métricas: valores separados por combinação de rótulos"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Rótulos de {self.name} devem ser {self.labels}, recebido {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines += self._render_value(key, value)
+        return lines
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{format_labels(self.labels, key)} {value}']
+
+    def empty(self):
+        """Métrica com a mesma definição e sem valores"""
+        return type(self)(self.name, self.help, self.labels)
+
+    def snapshot(self):
+        """Valores como lista [[rótulos, valor], ...] (serializável em JSON)"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, values):
+        """Soma os valores de outro processo (lista de `snapshot()`)"""
+        with self._lock:
+            for key, value in values:
+                key = tuple(key)
+                self._values[key] = self._combine(self._values.get(key), value)
+
+    def _combine(self, current, value):
+        return value if current is None else current + value
+
+
+class Counter(Metric):
+    """Contador que só cresce"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Valor instantâneo (atualizado por quem o conhece)
+
+    Entre processos, os valores dos processos vivos são somados
+    (`aggregate='sum'`) ou é usado o maior (`aggregate='max'`).
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), aggregate='sum'):
+        super().__init__(name, help_text, labels)
+        if aggregate not in ('sum', 'max'):
+            raise ValueError(f"Agregação inválida para {name}: {aggregate}")
+        self.aggregate = aggregate
+
+    def empty(self):
+        return type(self)(self.name, self.help, self.labels, self.aggregate)
+
+    def _combine(self, current, value):
+        if current is None:
+            return value
+        return current + value if self.aggregate == 'sum' else max(current, value)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Distribuição de durações em buckets cumulativos, com soma e contagem"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mede o bloco (também quando ele lança exceção)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def empty(self):
+        return type(self)(self.name, self.help, self.labels, self.buckets)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(state[0]), state[1], state[2]]] for key, state in self._values.items()]
+
+    def _combine(self, current, value):
+        if current is None:
+            return [list(value[0]), value[1], value[2]]
+        return [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]]
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines = [
+            f'{self.name}_bucket{format_labels(self.labels, key, [("le", repr(float(bound)))])} {n}'
+            for bound, n in zip(self.buckets, counts)
+        ]
+        lines.append(f'{self.name}_bucket{format_labels(self.labels, key, [("le", "+Inf")])} {count}')
+        lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {total}')
+        lines.append(f'{self.name}_count{format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas do processo, exportadas no formato texto do Prometheus
+
+    Com vários processos atrás da mesma porta (workers do servidor ASGI),
+    cada um tem o seu registro; com `share(diretório)`, cada processo grava
+    periodicamente seus valores em `<pid>.json` no diretório e `render()`
+    soma os de todos, como no modo multiprocesso do cliente Prometheus.
+    Contadores e histogramas de processos que já terminaram continuam na
+    soma (os totais nunca diminuem); gauges só contam processos vivos
+    (arquivo atualizado há menos de três intervalos).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.directory = None
+        self.flush_interval = METRICS_FLUSH_SECONDS
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Métrica {name} já registrada como {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=(), aggregate='sum'):
+        return self._register(Gauge, name, help_text, labels, aggregate)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labels, buckets)
+
+    def add_collector(self, callback):
+        """Registra `callback()`, chamado antes de exportar (atualiza gauges)"""
+        self._collectors.append(callback)
+
+    def collect(self):
+        for callback in self._collectors:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Erro ao coletar métricas: {e}")
+
+    def share(self, directory, flush_interval=METRICS_FLUSH_SECONDS):
+        """Passa a agregar as métricas dos processos que usam `directory`"""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def dump(self):
+        """Grava os valores deste processo no diretório compartilhado"""
+        self.collect()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump({metric.name: metric.snapshot() for metric in metrics}, f)
+        os.replace(path + '.tmp', path)  # Leitores nunca veem um arquivo pela metade
+
+    def _flush_loop(self):
+        while True:
+            try:
+                self.dump()
+            except Exception as e:
+                logger.error(f"Erro ao gravar métricas: {e}")
+            time.sleep(self.flush_interval)
+
+    def _merged(self):
+        """Métricas com os valores somados de todos os processos do diretório"""
+        self.dump()
+        with self._lock:
+            merged = {name: metric.empty() for name, metric in self._metrics.items()}
+
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                alive = now - os.path.getmtime(path) < 3 * self.flush_interval
+                with open(path) as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                continue  # Removido ou substituído durante a leitura
+            for metric_name, metric_values in values.items():
+                metric = merged.get(metric_name)
+                if metric is not None and (alive or metric.kind != 'gauge'):
+                    metric.merge(metric_values)
+        return list(merged.values())
+
+    def render(self):
+        if self.directory is not None:
+            metrics = self._merged()
+        else:
+            self.collect()
+            with self._lock:
+                metrics = list(self._metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+# Registro compartilhado pelos módulos do processo
+REGISTRY = MetricsRegistry()
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'db_query_seconds', 'Duração das consultas ao SQLite', ['operation'])
+DB_TRANSACTION_SECONDS = REGISTRY.histogram(
+    'db_transaction_seconds', 'Duração das transações de escrita no SQLite')
+SOURCE_FETCH_SECONDS = REGISTRY.histogram(
+    'source_fetch_seconds', 'Duração das buscas em fontes externas', ['source'])
+SOURCE_ERRORS = REGISTRY.counter(
+    'source_errors_total', 'Falhas ao buscar dados em fontes externas', ['source'])
+SAVE_BATCH_SECONDS = REGISTRY.histogram(
+    'save_batch_seconds', 'Duração da gravação de cada lote', ['table'])
+ROWS_SAVED = REGISTRY.counter(
+    'rows_saved_total', 'Linhas gravadas', ['table'])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_seconds', 'Duração das requisições HTTP', ['endpoint', 'method', 'status'])
+RESPONSE_CACHE_EVENTS = REGISTRY.counter(
+    'response_cache_events_total', 'Acertos e falhas do cache de respostas', ['result'])
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Migra bancos investment_data.db para a versão atual do esquema
+
+A migração também roda automaticamente ao abrir o banco com o
+DataCollector; este script permite convertê-los em lote, antes de subir o
+servidor, e compacta cada arquivo (VACUUM) em seguida.
+
+    python migrate.py investment_data.db outro.db
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from data_collector import DataCollector, SCHEMA_VERSION
+from database import ConnectionManager
+
+
+def file_size(path):
+    """Tamanho do banco em bytes (incluindo o WAL, se houver)"""
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def migrate(path, vacuum=True):
+    """Migra e compacta um banco; retorna (versão anterior, bytes antes, bytes depois)"""
+    before = file_size(path)
+    db = ConnectionManager(path)
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    db.close_all()
+
+    # Abrir o coletor cria ou migra o esquema
+    collector = DataCollector(path)
+    if vacuum:
+        conn = collector.db.connection()
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    collector.db.close_all()
+    return version, before, file_size(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migra bancos para a versão atual do esquema')
+    parser.add_argument('paths', nargs='+', help='arquivos SQLite')
+    parser.add_argument('--no-vacuum', action='store_true', help='não compactar após a migração')
+    args = parser.parse_args()
+
+    logging.getLogger('data_collector').setLevel(logging.WARNING)
+    for path in args.paths:
+        if not os.path.exists(path):
+            print(f"❌ {path}: arquivo não encontrado")
+            continue
+        started = time.perf_counter()
+        version, before, after = migrate(path, vacuum=not args.no_vacuum)
+        print(f"✅ {path}: versão {version} -> {SCHEMA_VERSION}, "
+              f"{before / 2 ** 20:.2f} MB -> {after / 2 ** 20:.2f} MB "
+              f"em {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import numpy as np
+from itertools import combinations
+from timeseries import align_prices
+
+# Frequências de rebalanceamento suportadas ('none': comprar e manter)
+REBALANCE_FREQUENCIES = ('none', 'daily', 'weekly', 'monthly', 'quarterly', 'yearly')
+
+# Combinações de pesos simuladas por vez (limita a memória das matrizes combinações x dias)
+CHUNK_SIZE = 512
+
+
+def rebalance_mask(dates, frequency):
+    """Dias de rebalanceamento: a primeira data de cada novo período
+
+    A data inicial nunca é marcada (é a compra inicial). Semanas começam na
+    segunda-feira.
+    """
+    if frequency not in REBALANCE_FREQUENCIES:
+        raise ValueError(f"Frequência de rebalanceamento desconhecida: {frequency}")
+    if frequency == 'none' or len(dates) < 2:
+        return np.zeros(len(dates), dtype=bool)
+    if frequency == 'daily':
+        return np.r_[False, np.ones(len(dates) - 1, dtype=bool)]
+
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    if frequency == 'weekly':
+        period = (days + 3) // 7  # 1970-01-01 foi uma quinta-feira
+    elif frequency == 'yearly':
+        period = dates.astype('datetime64[Y]').astype(np.int64)
+    else:
+        period = dates.astype('datetime64[M]').astype(np.int64)
+        if frequency == 'quarterly':
+            period = period // 3
+    return np.r_[False, period[1:] != period[:-1]]
+
+
+def weight_grid(n_assets, step):
+    """Todas as alocações com pesos múltiplos de `step` que somam 1
+
+    Usada nas varreduras de alocação: com `step` 0.1 e 3 ativos gera as 66
+    combinações (1, 0, 0), (0.9, 0.1, 0)... Retorna uma matriz
+    (combinações x ativos).
+    """
+    parts = int(round(1 / step))
+    if n_assets == 1:
+        return np.ones((1, 1))
+    # Estrelas e barras: cada escolha de posições das barras é uma combinação
+    bars = np.array(list(combinations(range(parts + n_assets - 1), n_assets - 1)))
+    edges = np.column_stack([np.full(len(bars), -1), bars, np.full(len(bars), parts + n_assets - 1)])
+    return (np.diff(edges, axis=1) - 1) / parts
+
+
+def _simulate_chunk(weights, prices, bounds, cost_rate, amount):
+    """Valor diário (combinações x dias), giro e custos de um lote de alocações
+
+    Entre dois rebalanceamentos as cotas ficam fixas, então o valor de cada
+    trecho é um único produto matricial (cotas x preços). Em cada
+    rebalanceamento as cotas voltam aos pesos-alvo; o custo é cobrado sobre
+    o valor negociado e sai do patrimônio antes da nova compra.
+    """
+    values = np.empty((len(weights), len(prices)))
+
+    # Compra inicial (também paga custos)
+    costs = amount * (weights * cost_rate).sum(axis=1)
+    value = amount - costs
+    units = weights * value[:, None] / prices[0]
+    turnover = np.zeros(len(weights))
+
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start > 0:
+            holdings = units * prices[start]
+            value = holdings.sum(axis=1)
+            trades = np.abs(weights * value[:, None] - holdings)
+            cost = (trades * cost_rate).sum(axis=1)
+            turnover += trades.sum(axis=1) / 2 / value  # Giro em um sentido (compras ou vendas)
+            costs += cost
+            value = value - cost
+            units = weights * value[:, None] / prices[start]
+        values[:, start:end] = units @ prices[start:end].T
+
+    return values, turnover, costs
+
+
+def backtest_portfolios(history, weights, start_date, end_date, rebalance='monthly',
+                        cost_bps=0.0, amount=1.0, risk_free_rate=0.0, keep_values=False):
+    """Simula carteiras com pesos fixos, rebalanceamento periódico e custos
+
+    `history` é {símbolo: (datas, preços)} e `weights` uma matriz
+    (combinações x ativos), na ordem de `history`; cada linha é normalizada
+    para somar 1. `cost_bps` é o custo por operação em pontos-base (um valor
+    ou um por ativo) e `risk_free_rate` a taxa livre de risco anual (fração)
+    do índice de Sharpe. Todas as combinações são simuladas juntas sobre a
+    matriz de preços alinhada (dias x ativos), em lotes de CHUNK_SIZE.
+
+    Retorna (datas, resultados): vetores por combinação com valor final,
+    retornos, volatilidade anualizada, Sharpe, drawdown máximo, giro total,
+    custos pagos e número de rebalanceamentos; com `keep_values`, também a
+    matriz de valores diários (combinações x datas).
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    if weights.shape[1] != len(history):
+        raise ValueError(f"Esperados {len(history)} pesos por combinação, recebido {weights.shape[1]}")
+    if (weights < 0).any() or (weights.sum(axis=1) <= 0).any():
+        raise ValueError("Pesos devem ser não negativos e somar mais que zero")
+    weights = weights / weights.sum(axis=1, keepdims=True)
+
+    dates, names, prices = align_prices(history, start_date, end_date)
+    missing = [name for name, price in zip(names, prices[0]) if not price > 0]
+    if missing:
+        raise ValueError(f"Sem preço na data inicial: {', '.join(missing)}")
+
+    cost_rate = np.broadcast_to(np.asarray(cost_bps, dtype=float) / 10_000, (len(names),))
+    rebalance_days = np.flatnonzero(rebalance_mask(dates, rebalance))
+    bounds = np.r_[0, rebalance_days, len(dates)]
+
+    years = int((dates[-1] - dates[0]).astype(int)) / 365.25
+    periods_per_year = (len(dates) - 1) / years if years > 0 else np.nan
+    inverse_years = 1 / years if years > 0 else np.nan
+
+    stats = {key: [] for key in ('final_value', 'return_percentage', 'annualized_return_percentage',
+                                 'volatility_percentage', 'sharpe', 'max_drawdown_percentage',
+                                 'turnover', 'costs')}
+    all_values = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for chunk in range(0, len(weights), CHUNK_SIZE):
+            values, turnover, costs = _simulate_chunk(
+                weights[chunk:chunk + CHUNK_SIZE], prices, bounds, cost_rate, amount)
+
+            final = values[:, -1]
+            log_returns = np.diff(np.log(values), axis=1)
+            volatility = log_returns.std(axis=1, ddof=1) * np.sqrt(periods_per_year)
+            excess = log_returns.mean(axis=1) * periods_per_year - np.log1p(risk_free_rate)
+            drawdown = (values / np.maximum.accumulate(values, axis=1) - 1).min(axis=1)
+
+            stats['final_value'].append(final)
+            stats['return_percentage'].append((final / amount - 1) * 100)
+            stats['annualized_return_percentage'].append(((final / amount) ** inverse_years - 1) * 100)
+            stats['volatility_percentage'].append(volatility * 100)
+            stats['sharpe'].append(excess / volatility)
+            stats['max_drawdown_percentage'].append(drawdown * 100)
+            stats['turnover'].append(turnover)
+            stats['costs'].append(costs)
+            if keep_values:
+                all_values.append(values)
+
+    results = {key: np.concatenate(parts) for key, parts in stats.items()}
+    results['weights'] = weights
+    results['rebalances'] = len(rebalance_days)
+    if keep_values:
+        results['values'] = np.concatenate(all_values)
+    return dates, results
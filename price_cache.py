@@ -0,0 +1,151 @@
+import threading
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Maior distância (em dias) aceita ao resolver uma data para o pregão anterior
+MAX_STALENESS_DAYS = 10
+
+
+def to_datetime64(dates):
+    """Converte datas (texto 'YYYY-MM-DD' ou datetime) para datetime64[D]"""
+    return np.array([str(d)[:10] for d in dates], dtype='datetime64[D]')
+
+
+def days_to_datetime64(days):
+    """Converte dias desde 1970-01-01 (a chave de data do banco) para datetime64[D]"""
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]')
+
+
+class PriceCache:
+    """Cache em memória dos fechamentos diários, em arrays NumPy por símbolo
+
+    A carga inicial lê todas as tabelas de preços uma única vez. Escritas
+    feitas pelo próprio processo são aplicadas diretamente com `apply()`;
+    escritas de outros processos (ex.: scheduler.py) são detectadas pelo
+    contador de versão do banco, verificado no máximo a cada
+    `refresh_interval` segundos, e carregadas de forma incremental.
+    """
+
+    def __init__(self, collector, refresh_interval=5.0):
+        self.collector = collector
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self.updated_at = None  # Momento da última escrita (epoch)
+
+        self._series = {}  # símbolo -> (datas datetime64[D], preços float64)
+        self._lock = threading.RLock()
+        self._last_check = 0.0
+        self._watermark = None  # Maior updated_at já carregado
+
+    def load(self):
+        """Carrega todo o histórico de preços do banco"""
+        with self._lock:
+            self._series = {}
+            self._watermark = None
+            self._load_since(None)
+        logger.info(f"Cache de preços carregado: {len(self._series)} símbolos")
+
+    def _load_since(self, since):
+        # A versão é lida antes das linhas: uma escrita concorrente será
+        # reaplicada na próxima verificação, nunca perdida
+        self.version, self.updated_at = self.collector.read_data_state()
+        self._last_check = time.monotonic()
+
+        grouped = {}
+        for symbol, day, price, updated_at in self.collector.iter_price_rows(since):
+            grouped.setdefault(symbol, ([], []))
+            grouped[symbol][0].append(day)
+            grouped[symbol][1].append(price)
+            if updated_at and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+        for symbol, (dates, prices) in grouped.items():
+            self._merge(symbol, days_to_datetime64(dates), np.array(prices, dtype=float))
+
+    def _merge(self, symbol, dates, prices):
+        valid = ~np.isnan(prices)
+        dates, prices = dates[valid], prices[valid]
+
+        current = self._series.get(symbol)
+        if current is not None:
+            dates = np.concatenate([current[0], dates])
+            prices = np.concatenate([current[1], prices])
+
+        # Em datas repetidas prevalece o valor mais recente (último do array)
+        dates, prices = dates[::-1], prices[::-1]
+        dates, index = np.unique(dates, return_index=True)
+        # Substitui a série inteira: leitores concorrentes nunca veem arrays pela metade
+        self._series[symbol] = (dates, prices[index])
+
+    def apply(self, symbol, dates, prices, state=None):
+        """Aplica novos registros gravados por este processo
+
+        `state` é o par (versão, atualização) retornado pela escrita. Ele só
+        é adotado se a escrita foi a única desde a versão em cache; se outro
+        processo gravou no meio, a versão fica para trás e o próximo
+        `refresh()` carrega as linhas dele.
+        """
+        with self._lock:
+            self._merge(symbol, to_datetime64(dates), np.array(prices, dtype=float))
+            if state is not None and self.version is not None and state[0] == self.version + 1:
+                self.version, self.updated_at = state
+
+    def refresh(self, force=False):
+        """Carrega alterações feitas por outros processos, se houver"""
+        if not force and time.monotonic() - self._last_check < self.refresh_interval:
+            return
+        with self._lock:
+            self._last_check = time.monotonic()
+            version, _ = self.collector.read_data_state()
+            if version != self.version:
+                self._load_since(self._watermark)
+
+    def symbols(self):
+        return list(self._series)
+
+    def get_series(self, symbol):
+        """Retorna (datas, preços) do símbolo ou None"""
+        self.refresh()
+        return self._series.get(symbol)
+
+    def resolve(self, symbol, date, max_staleness=MAX_STALENESS_DAYS):
+        """Resolve `date` para o pregão anterior mais próximo (busca binária)
+
+        Retorna (data, preço) ou None se não houver pregão até `date` dentro
+        de `max_staleness` dias.
+        """
+        series = self.get_series(symbol)
+        if series is None:
+            return None
+        dates, prices = series
+        target = np.datetime64(str(date)[:10], 'D')
+        i = np.searchsorted(dates, target, side='right') - 1
+        if i < 0 or target - dates[i] > np.timedelta64(max_staleness, 'D'):
+            return None
+        return str(dates[i]), float(prices[i])
+
+    def get_price(self, symbol, date=None):
+        """Preço em `date` (ou no pregão anterior) ou o mais recente, se `date` for None"""
+        if date is None:
+            series = self.get_series(symbol)
+            if series is None or len(series[0]) == 0:
+                return None
+            return float(series[1][-1])
+
+        resolved = self.resolve(symbol, date)
+        return resolved[1] if resolved else None
+
+    def get_latest_price(self, symbol, end_date=None):
+        """Último preço até `end_date` (inclusive), ou o mais recente"""
+        series = self.get_series(symbol)
+        if series is None:
+            return None
+        dates, prices = series
+        if end_date is None:
+            i = len(dates)
+        else:
+            i = np.searchsorted(dates, np.datetime64(str(end_date)[:10], 'D'), side='right')
+        return float(prices[i - 1]) if i > 0 else None
@@ -0,0 +1,37 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Janela (em pregões) da volatilidade móvel
+VOLATILITY_WINDOW = 30
+
+
+def compute_stats(prices, first_price, prev_price=np.nan, prev_returns=(), prev_max=np.nan,
+                  window=VOLATILITY_WINDOW):
+    """Calcula as estatísticas derivadas de novos fechamentos de um símbolo
+
+    O contexto vem das linhas já materializadas: `first_price` (primeiro
+    fechamento do histórico), `prev_price` e `prev_max` do dia anterior ao
+    trecho e até `window - 1` retornos anteriores. Retorna arrays com o
+    retorno logarítmico diário, o índice de retorno acumulado
+    (preço / primeiro preço), a volatilidade móvel (desvio padrão dos
+    retornos diários na janela) e o máximo acumulado do índice.
+    """
+    prices = np.asarray(prices, dtype=float)
+    prev_returns = np.asarray(prev_returns, dtype=float)[-(window - 1):] if window > 1 else np.array([])
+
+    previous = np.r_[prev_price, prices[:-1]]
+    log_returns = np.log(prices / previous)
+    cum_index = prices / first_price
+    rolling_max = np.fmax.accumulate(np.r_[prev_max, cum_index])[1:]
+
+    returns = np.r_[prev_returns, log_returns]
+    volatility = np.full(len(prices), np.nan)
+    if len(returns) >= window:
+        stds = sliding_window_view(returns, window).std(axis=1, ddof=1)
+        # O desvio da janela que termina no novo dia k está em stds[len(prev_returns) + k - window + 1]
+        first = len(prev_returns) - window + 1
+        k = np.arange(len(prices))
+        valid = first + k >= 0
+        volatility[valid] = stds[first + k[valid]]
+
+    return log_returns, cum_index, volatility, rolling_max
@@ -0,0 +1,56 @@
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Limitador de taxa do tipo token bucket (seguro entre threads)
+
+    Libera até `capacity` chamadas em rajada e depois `rate` chamadas por
+    segundo. `clock` e `sleep` podem ser trocados em testes/benchmarks.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.clock = clock
+        self.sleep = sleep
+
+        self._tokens = self.capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """Bloqueia até haver `tokens` disponíveis; retorna o tempo esperado"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            self.sleep(delay)
+            waited += delay
+
+
+def retry_with_backoff(func, retries=3, base_delay=1.0, max_delay=30.0,
+                       exceptions=(Exception,), sleep=time.sleep):
+    """Executa `func`, repetindo com backoff exponencial (com jitter) em caso de erro"""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except exceptions as e:
+            if attempt == retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Tentativa {attempt + 1} falhou ({e}); nova tentativa em {delay:.1f}s")
+            sleep(delay)
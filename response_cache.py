@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+from metrics import RESPONSE_CACHE_EVENTS
+
+
+class ResponseCache:
+    """Cache LRU com expiração (TTL) para resultados das rotas
+
+    As chaves devem incluir a versão dos dados, de modo que uma escrita do
+    coletor torna as entradas antigas inalcançáveis; elas saem pelo LRU ou
+    pelo TTL.
+    """
+
+    def __init__(self, max_entries=512, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+
+        self._entries = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                RESPONSE_CACHE_EVENTS.inc(result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            RESPONSE_CACHE_EVENTS.inc(result='hit')
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Retorna o valor em cache ou calcula e armazena com `compute()`"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,8 +1,9 @@
-import schedule
 import time
 import logging
 from data_collector import DataCollector
-from datetime import datetime
+from datetime import datetime, timedelta, time as time_of_day
+from intraday import INTERVALS
+from locks import LeaseLock
 
 # Configurar logging
 logging.basicConfig(
@@ -15,69 +16,147 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class DataScheduler:
-    def __init__(self):
-        self.collector = DataCollector()
+# Coletas agendadas (horário local): (tipo, janela em dias, horários, regra do dia)
+SCHEDULE = (
+    ('daily', 2, (time_of_day(9), time_of_day(18)), lambda day: True),      # Todo dia às 9h e às 18h
+    ('weekly', 7, (time_of_day(8),), lambda day: day.weekday() == 6),       # Domingo às 8h
+    ('monthly', 30, (time_of_day(8),), lambda day: day.day == 1),           # Dia 1º às 8h
+)
 
-    def daily_update(self):
-        """Atualização diária - coleta dados dos últimos 2 dias"""
-        try:
-            logger.info("🔄 Iniciando atualização diária...")
-            self.collector.update_all_data(days=2)
+# Maior janela recuperada após um período parado (dias)
+MAX_CATCH_UP_DAYS = 366
 
-            # Mostrar resumo após atualização
-            summary = self.collector.get_data_summary()
-            logger.info(f"✅ Atualização concluída - BTC: {summary['bitcoin_records']} registros, Ações: {summary['stock_records']} registros")
+# Nova tentativa quando a coleta foi ignorada porque outra estava rodando (s)
+RETRY_SECONDS = 60
 
-        except Exception as e:
-            logger.error(f"❌ Erro na atualização diária: {e}")
+# Intervalo da coleta intradiária do Bitcoin
+INTRADAY_INTERVAL = '5m'
 
-    def weekly_update(self):
-        """Atualização semanal - coleta dados dos últimos 7 dias"""
-        try:
-            logger.info("🔄 Iniciando atualização semanal...")
-            self.collector.update_all_data(days=7)
-            logger.info("✅ Atualização semanal concluída")
 
-        except Exception as e:
-            logger.error(f"❌ Erro na atualização semanal: {e}")
+def scheduled_slots(start, end):
+    """Horários agendados em (start, end], como (momento, tipo, janela em dias)"""
+    slots = []
+    day = start.date()
+    while day <= end.date():
+        for kind, days, times, matches in SCHEDULE:
+            if not matches(day):
+                continue
+            for at in times:
+                moment = datetime.combine(day, at)
+                if start < moment <= end:
+                    slots.append((moment, kind, days))
+        day += timedelta(days=1)
+    return sorted(slots)
+
+
+def next_slot(now):
+    """Próximo horário agendado depois de `now`"""
+    return scheduled_slots(now, now + timedelta(days=2))[0][0]
 
-    def monthly_update(self):
-        """Atualização mensal - coleta dados dos últimos 30 dias"""
-        try:
-            logger.info("🔄 Iniciando atualização mensal...")
-            self.collector.update_all_data(days=30)
-            logger.info("✅ Atualização mensal concluída")
 
+class DataScheduler:
+    """Agendador das coletas, com histórico no banco
+
+    Os horários vencidos desde a última execução registrada (inclusive os
+    perdidos enquanto o processo estava parado) são atendidos por uma
+    única coleta, com a maior janela entre eles e o tempo desde a última
+    coleta concluída. A coleta roda sob o lock entre processos do coletor:
+    se o servidor web (/update-data) ou outro scheduler estiver coletando,
+    tenta de novo depois.
+    """
+
+    def __init__(self):
+        self.collector = DataCollector()
+        self._intraday_lock = LeaseLock(self.collector.db, 'intraday', ttl=INTERVALS[INTRADAY_INTERVAL])
+
+    def last_scheduled(self):
+        """Último horário já atendido pelo agendador (None sem histórico)"""
+        row = self.collector.db.execute("""
+            SELECT MAX(scheduled_for) FROM collection_runs
+            WHERE trigger = 'scheduler' AND status != 'skipped'
+        """).fetchone()
+        return datetime.fromtimestamp(row[0]) if row[0] else None
+
+    def last_success(self):
+        """Início da última coleta concluída, de qualquer origem (None sem histórico)"""
+        row = self.collector.db.execute(
+            "SELECT MAX(started_at) FROM collection_runs WHERE status = 'done'").fetchone()
+        return datetime.fromtimestamp(row[0]) if row[0] else None
+
+    def run_pending(self, now=None):
+        """Atende em uma única coleta os horários vencidos; retorna a execução ou None
+
+        Sem histórico, considera vencidos os horários das últimas 24 horas.
+        """
+        now = now or datetime.now()
+        since = self.last_scheduled() or now - timedelta(days=1)
+        due = scheduled_slots(max(since, now - timedelta(days=MAX_CATCH_UP_DAYS)), now)
+        if not due:
+            return None
+
+        kinds = sorted({kind for _, kind, _ in due})
+        days = max(days for _, _, days in due)
+        last_success = self.last_success()
+        if last_success is not None:
+            days = max(days, (now.date() - last_success.date()).days + 1)
+        days = min(days, MAX_CATCH_UP_DAYS)
+        if len(due) > 1:
+            logger.info(f"⏰ {len(due)} horários vencidos desde {since:%Y-%m-%d %H:%M}: uma coleta de {days} dias")
+
+        logger.info(f"🔄 Iniciando coleta agendada ({'+'.join(kinds)})...")
+        run = self.collector.run_collection(
+            days=days, kind='+'.join(kinds), trigger='scheduler',
+            scheduled_for=int(due[-1][0].timestamp())
+        )
+        if run['status'] == 'done':
+            summary = self.collector.get_data_summary()
+            logger.info(f"✅ Coleta concluída em {run['duration_seconds']:.1f}s - "
+                        f"BTC: {summary['bitcoin_records']} registros, Ações: {summary['stock_records']} registros")
+        elif run['status'] == 'failed':
+            logger.error(f"❌ Erro na coleta agendada: {run['error']}")
+        return run
+
+    def intraday_update(self):
+        """Atualização intradiária - barras de 5 minutos do Bitcoin (uma por vez entre processos)"""
+        if not self._intraday_lock.acquire():
+            return
+        try:
+            self.collector.update_bitcoin_intraday(interval=INTRADAY_INTERVAL)
         except Exception as e:
-            logger.error(f"❌ Erro na atualização mensal: {e}")
+            logger.error(f"❌ Erro na atualização intradiária: {e}")
+        finally:
+            self._intraday_lock.release()
 
     def start_scheduler(self):
-        """Inicia o agendador"""
+        """Inicia o agendador (dorme até o próximo horário ou coleta intradiária)"""
         logger.info("🚀 Iniciando agendador de atualizações...")
-
-        # Agendar atualizações
-        schedule.every().day.at("09:00").do(self.daily_update)      # Todo dia às 9h
-        schedule.every().day.at("18:00").do(self.daily_update)      # Todo dia às 18h
-        schedule.every().sunday.at("08:00").do(self.weekly_update)  # Domingo às 8h
-        schedule.every().month.do(self.monthly_update)              # Todo mês
-
         logger.info("📅 Agendamentos configurados:")
-        logger.info("   - Atualização diária: 09:00 e 18:00")
-        logger.info("   - Atualização semanal: Domingo 08:00")
-        logger.info("   - Atualização mensal: Todo mês")
+        logger.info("   - Atualização diária: 09:00 e 18:00 (2 dias)")
+        logger.info("   - Atualização semanal: Domingo 08:00 (7 dias)")
+        logger.info("   - Atualização mensal: dia 1º 08:00 (30 dias)")
+        logger.info(f"   - Bitcoin intradiário: a cada {INTERVALS[INTRADAY_INTERVAL] // 60} minutos")
 
-        # Loop principal
+        intraday_seconds = INTERVALS[INTRADAY_INTERVAL]
+        next_intraday = time.monotonic()
         while True:
-            schedule.run_pending()
-            time.sleep(60)  # Verificar a cada minuto
+            run = self.run_pending()
+
+            if time.monotonic() >= next_intraday:
+                self.intraday_update()
+                next_intraday = time.monotonic() + intraday_seconds
+
+            wait = min((next_slot(datetime.now()) - datetime.now()).total_seconds(),
+                       next_intraday - time.monotonic())
+            if run is not None and run['status'] == 'skipped':
+                wait = min(wait, RETRY_SECONDS)
+            time.sleep(max(wait, 1))
 
 if __name__ == "__main__":
     scheduler = DataScheduler()
 
-    # Fazer uma atualização inicial
-    print("🔄 Fazendo atualização inicial...")
-    scheduler.daily_update()
+    # Atualização inicial: recupera os horários perdidos enquanto parado
+    print("🔄 Recuperando coletas pendentes...")
+    scheduler.run_pending()
 
     # Iniciar agendador
     scheduler.start_scheduler()
@@ -16,7 +16,6 @@ def install_requirements():
         'pandas',
         'requests',
         'beautifulsoup4',
-        'schedule',
         'sqlite3'  # Já vem com Python
     ]
 
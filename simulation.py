@@ -0,0 +1,84 @@
+import numpy as np
+from price_cache import MAX_STALENESS_DAYS
+from timeseries import forward_fill
+
+# Estratégias de aporte suportadas
+STRATEGIES = ('lump_sum', 'weekly', 'monthly')
+
+
+def contribution_schedule(grid, starts, end, strategy):
+    """Índices no `grid` diário dos aportes de cada data inicial
+
+    Retorna uma matriz (datas iniciais x aportes) de índices e a máscara dos
+    aportes válidos (até `end`). Aportes semanais caem a cada 7 dias; os
+    mensais, no mesmo dia do mês (ou no último dia, em meses mais curtos).
+    """
+    first = grid[0]
+    end_index = int((end - first).astype(int))
+    start_index = (starts - first).astype(int)
+
+    if strategy == 'lump_sum':
+        index = start_index[:, None]
+    elif strategy == 'weekly':
+        count = (end_index - start_index.min()) // 7 + 1
+        index = start_index[:, None] + 7 * np.arange(count)
+    elif strategy == 'monthly':
+        start_month = starts.astype('datetime64[M]')
+        day_offset = (starts - start_month.astype('datetime64[D]')).astype(int)
+        count = int((end.astype('datetime64[M]') - start_month.min()).astype(int)) + 1
+        months = start_month[:, None] + np.arange(count)
+        month_start = months.astype('datetime64[D]')
+        month_last = (months + 1).astype('datetime64[D]') - 1
+        dates = np.minimum(month_start + day_offset[:, None], month_last)
+        index = (dates - first).astype(int)
+    else:
+        raise ValueError(f"Estratégia desconhecida: {strategy}")
+
+    mask = index <= end_index
+    return np.where(mask, index, 0), mask
+
+
+def simulate_batch(history, start_dates, end_date, amounts, strategies=STRATEGIES):
+    """Simula vários cenários de investimento de uma só vez
+
+    Para cada ativo de `history` ({nome: (datas, preços)}), estratégia,
+    data inicial e valor, calcula o valor final em `end_date`. O valor é o
+    total investido: no aporte único vai todo na data inicial; nos aportes
+    periódicos é dividido igualmente entre as datas de aporte até
+    `end_date`. Preços de dias sem pregão usam o último fechamento; nas
+    compras, só se estiver a até MAX_STALENESS_DAYS dias (como o preço
+    inicial de DataCollector.get_price_pairs).
+
+    Retorna {ativo: {estratégia: {'final_value': matriz (datas x valores),
+    'return_percentage': vetor por data inicial, 'contributions': vetor}}};
+    cenários sem preço disponível ficam como NaN.
+    """
+    starts = np.array([str(d)[:10] for d in start_dates], dtype='datetime64[D]')
+    end = np.datetime64(str(end_date)[:10], 'D')
+    amounts = np.asarray(amounts, dtype=float)
+    starts = np.minimum(starts, end)
+
+    grid = np.arange(starts.min(), end + 1)
+    names = list(history)
+    # Matriz (dias x ativos) com o preço de compra vigente em cada dia
+    matrix = np.column_stack([forward_fill(dates, prices, grid, MAX_STALENESS_DAYS)
+                              for dates, prices in history.values()])
+    end_prices = np.array([forward_fill(dates, prices, grid[-1:])[0] for dates, prices in history.values()])
+
+    results = {name: {} for name in names}
+    for strategy in strategies:
+        index, mask = contribution_schedule(grid, starts, end, strategy)
+        contributions = mask.sum(axis=1)
+
+        # Cotas compradas com R$ 1 dividido entre os aportes (datas x ativos)
+        inverse = np.where(mask[:, :, None], 1.0 / matrix[index], 0.0)
+        units = inverse.sum(axis=1) / contributions[:, None]
+        growth = units * end_prices  # Valor final por R$ 1 investido
+
+        for j, name in enumerate(names):
+            results[name][strategy] = {
+                'final_value': growth[:, j][:, None] * amounts[None, :],
+                'return_percentage': (growth[:, j] - 1) * 100,
+                'contributions': contributions
+            }
+    return results
@@ -0,0 +1,70 @@
+import numpy as np
+from price_cache import MAX_STALENESS_DAYS
+
+
+def forward_fill(dates, prices, grid, max_staleness=None):
+    """Preço vigente em cada data de `grid` (último anterior; NaN antes do primeiro)
+
+    Com `max_staleness`, datas cujo último pregão ficou mais de
+    `max_staleness` dias para trás também ficam NaN (a mesma regra de
+    PriceCache.resolve).
+    """
+    i = np.searchsorted(dates, grid, side='right') - 1
+    filled = np.full(len(grid), np.nan)
+    known = i >= 0
+    if max_staleness is not None and len(dates):
+        known &= grid - dates[np.maximum(i, 0)] <= np.timedelta64(max_staleness, 'D')
+    filled[known] = prices[i[known]]
+    return filled
+
+
+def align_prices(history, start_date, end_date):
+    """Alinha os históricos em uma matriz (datas x ativos)
+
+    `history` é {nome: (datas datetime64[D], preços)}. As linhas são a data
+    inicial mais todas as datas com pregão de algum ativo no período; em
+    datas sem pregão de um ativo repete-se o último preço conhecido (NaN
+    antes do primeiro). Como em DataCollector.get_price_pairs, o preço na
+    data inicial só vale se o pregão estiver a até MAX_STALENESS_DAYS dias.
+    Retorna (datas, nomes, matriz).
+    """
+    start = np.datetime64(str(start_date)[:10], 'D')
+    end = np.datetime64(str(end_date)[:10], 'D')
+
+    names = list(history)
+    in_range = [dates[(dates > start) & (dates <= end)] for dates, _ in history.values()]
+    grid = np.union1d(np.array([start]), np.concatenate(in_range) if in_range else np.array([], dtype='datetime64[D]'))
+
+    matrix = np.column_stack([forward_fill(dates, prices, grid) for dates, prices in history.values()])
+    matrix[0] = [forward_fill(dates, prices, grid[:1], MAX_STALENESS_DAYS)[0] for dates, prices in history.values()]
+    return grid, names, matrix
+
+
+def compute_curves(history, start_date, end_date, amount=1.0):
+    """Calcula, para todos os ativos de uma vez, a evolução do investimento
+
+    Retorna as datas e, por ativo, o valor da carteira, o retorno acumulado
+    e o drawdown diário, além de resumos. Ativos sem preço na data inicial
+    são ignorados.
+    """
+    dates, names, matrix = align_prices(history, start_date, end_date)
+
+    valid = ~np.isnan(matrix[0]) & (matrix[0] > 0)
+    names = [name for name, ok in zip(names, valid) if ok]
+    matrix = matrix[:, valid]
+
+    cumulative = matrix / matrix[0] - 1
+    values = amount * (1 + cumulative)
+    drawdown = values / np.maximum.accumulate(values, axis=0) - 1
+
+    curves = {}
+    for j, name in enumerate(names):
+        curves[name] = {
+            'values': values[:, j],
+            'cumulative_return': cumulative[:, j],
+            'drawdown': drawdown[:, j],
+            'final_value': float(values[-1, j]),
+            'return_percentage': float(cumulative[-1, j] * 100),
+            'max_drawdown_percentage': float(drawdown[:, j].min() * 100)
+        }
+    return dates, curves